@@ -0,0 +1,92 @@
+# benchmarks/decode_bench.py
+"""
+Benchmark CPU giải mã response GraphQL (S_competition): dict + model_validate so với model_validate_json trên bytes.
+
+    python -m benchmarks.decode_bench --products 20 --edges 50
+"""
+import argparse
+import json
+import os
+import random
+import time
+import uuid
+
+os.environ.setdefault("MAIN_SHEET_ID", "fake-main")
+os.environ.setdefault("MAIN_SHEET_NAME", "Main")
+os.environ.setdefault("GOOGLE_KEY_PATH", "")
+os.environ.setdefault("CLIENT_ID", "")
+os.environ.setdefault("AUTH_ID", "")
+os.environ.setdefault("AUTH_SECRET", "")
+
+from models.eneba_models import SCompetitionGraphQLResponse  # noqa: E402
+
+
+def build_competition_response(products: int, edges: int, seed: int) -> bytes:
+    rng = random.Random(seed)
+    return json.dumps({
+        "data": {
+            "S_competition": [
+                {
+                    "productId": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "competition": {
+                        "totalCount": edges,
+                        "edges": [
+                            {
+                                "node": {
+                                    "isInStock": rng.random() < 0.8,
+                                    "merchantName": f"Merchant {rng.randint(1, 500)}",
+                                    "belongsToYou": False,
+                                    "price": {"amount": rng.randint(100, 10000), "currency": "EUR"},
+                                }
+                            }
+                            for _ in range(edges)
+                        ],
+                    },
+                }
+                for _ in range(products)
+            ]
+        }
+    }).encode()
+
+
+def decode_dict(content: bytes) -> SCompetitionGraphQLResponse:
+    """Cách cũ: parse ra dict, kiểm tra errors, rồi validate cả cây dict."""
+    response_json = json.loads(content)
+    if "errors" in response_json:
+        raise ValueError(response_json["errors"])
+    return SCompetitionGraphQLResponse.model_validate(response_json)
+
+
+def decode_bytes(content: bytes) -> SCompetitionGraphQLResponse:
+    """Cách mới: kiểm tra errors trên bytes, validate thẳng từ JSON."""
+    if b'"errors"' in content:
+        raise ValueError(json.loads(content)["errors"])
+    return SCompetitionGraphQLResponse.model_validate_json(content)
+
+
+def _bench(label: str, func, content: bytes, repeat: int) -> float:
+    func(content)  # warm-up
+    started = time.process_time()
+    for _ in range(repeat):
+        func(content)
+    per_call = (time.process_time() - started) / repeat
+    print(f"{label:<34} {per_call * 1e6:10.1f} µs CPU / response")
+    return per_call
+
+
+def run(args):
+    content = build_competition_response(args.products, args.edges, args.seed)
+    assert decode_dict(content) == decode_bytes(content)
+    print(f"S_competition response: {args.products} products x {args.edges} edges, {len(content) / 1024:.1f} KiB")
+    before = _bench("json.loads + model_validate", decode_dict, content, args.repeat)
+    after = _bench("model_validate_json (bytes)", decode_bytes, content, args.repeat)
+    print(f"-> {before / after:.2f}x faster")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GraphQL response decode benchmark.")
+    parser.add_argument("--products", type=int, default=20)
+    parser.add_argument("--edges", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
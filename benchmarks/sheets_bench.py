@@ -0,0 +1,107 @@
+# benchmarks/sheets_bench.py
+"""
+Benchmark offline cho phần Google Sheets (đọc sheet chính, hydrate, ghi log) dùng FakeGoogleSheetsClient.
+
+    python -m benchmarks.sheets_bench --rows 10000 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# Giá trị mặc định để chạy không cần settings.env; quota nới rộng để đo throughput thuần
+os.environ.setdefault("MAIN_SHEET_ID", "fake-main")
+os.environ.setdefault("MAIN_SHEET_NAME", "Main")
+os.environ.setdefault("GOOGLE_KEY_PATH", "")
+os.environ.setdefault("CLIENT_ID", "")
+os.environ.setdefault("AUTH_ID", "")
+os.environ.setdefault("AUTH_SECRET", "")
+os.environ.setdefault("SHEETS_READS_PER_MINUTE", "100000")
+os.environ.setdefault("SHEETS_WRITES_PER_MINUTE", "100000")
+os.environ.setdefault("SHEETS_BUCKET_BURST", "1000")
+
+from clients.fake_google_sheets_client import FakeGoogleSheetsClient  # noqa: E402
+from services.sheet_log_writer import SheetLogWriter  # noqa: E402
+from services.sheet_service import SheetService  # noqa: E402
+from utils.config import settings  # noqa: E402
+from utils.sheet_workload import generate_workload  # noqa: E402
+
+
+async def _timed(label: str, client: FakeGoogleSheetsClient, coro):
+    client.calls.clear()
+    started = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms   calls={dict(client.calls)}")
+    return result
+
+
+async def _compare_read_modes(client: FakeGoogleSheetsClient, modes):
+    """So sánh các chế độ đọc sheet chính: thời gian đến lô đầu tiên và tổng thời gian."""
+    for mode in modes:
+        settings.MAIN_SHEET_READ_MODE = mode
+        sheet_service = SheetService(client=client)
+        client.calls.clear()
+        started = time.perf_counter()
+        first_batch_at = None
+        count = 0
+        async for batch in sheet_service.iter_payload_batches():
+            if first_batch_at is None:
+                first_batch_at = time.perf_counter() - started
+            count += len(batch)
+        elapsed = time.perf_counter() - started
+        first_ms = first_batch_at * 1000 if first_batch_at is not None else 0.0
+        print(f"read mode {mode:<10} first batch {first_ms:8.1f} ms   total {elapsed * 1000:8.1f} ms   "
+              f"payloads={count} calls={dict(client.calls)}")
+        await sheet_service.scheduler.close()
+    settings.MAIN_SHEET_READ_MODE = "full"
+
+
+async def _per_row_logs(sheet_service: SheetService, payloads, log_data):
+    for payload in payloads:
+        await sheet_service.update_log_for_payload(payload, log_data)
+
+
+async def _write_behind_logs(sheet_service: SheetService, payloads, log_data):
+    log_writer = SheetLogWriter(sheet_service=sheet_service)
+    for payload in payloads:
+        log_writer.enqueue(payload, log_data)
+    return await log_writer.flush()
+
+
+async def run(args):
+    client = FakeGoogleSheetsClient(latency=args.latency, quota_error_rate=args.quota_error_rate)
+    generate_workload(client, settings.MAIN_SHEET_ID, settings.MAIN_SHEET_NAME, rows=args.rows,
+                      enabled_ratio=args.enabled_ratio, price_refs=args.price_refs, seed=args.seed)
+    sheet_service = SheetService(client=client)
+
+    print(f"rows={args.rows} latency={args.latency}s quota_error_rate={args.quota_error_rate}")
+    await _compare_read_modes(client, ["full", "projected", "csv"])
+    payloads = await _timed("get_payloads_to_process (cold)", client, sheet_service.get_payloads_to_process())
+    await _timed("get_payloads_to_process (unchanged)", client, sheet_service.get_payloads_to_process())
+    print(f"-> {len(payloads)} enabled payloads")
+
+    await _timed("hydrate_payloads (cold cache)", client, sheet_service.hydrate_payloads(payloads))
+    await _timed("hydrate_payloads (warm cache)", client, sheet_service.hydrate_payloads(payloads))
+
+    sample = payloads[:args.log_rows]
+    log_data = {'note': "benchmark", 'last_update': time.strftime('%Y-%m-%d %H:%M:%S')}
+    await _timed(f"per-row log writes ({len(sample)} rows)", client,
+                 _per_row_logs(sheet_service, sample, log_data))
+    stats = await _timed(f"write-behind log flush ({len(sample)} rows)", client,
+                         _write_behind_logs(sheet_service, sample, log_data))
+    print(f"-> {stats}")
+    print(f"scheduler: {sheet_service.scheduler.levels()}")
+    await sheet_service.scheduler.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Google Sheets throughput benchmark.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--enabled-ratio", type=float, default=0.6)
+    parser.add_argument("--price-refs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--quota-error-rate", type=float, default=0.0)
+    parser.add_argument("--log-rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,236 @@
+# clients/async_google_sheets_client.py
+import asyncio
+import logging
+import time
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from urllib.parse import quote
+
+import httpx
+from google.auth import jwt
+from google.oauth2 import service_account
+
+from clients.exceptions import SheetsRateLimitError, SheetsRequestError
+from clients.google_sheets_client import normalize_value_ranges, ordered_value_ranges
+from utils.csv_stream import aiter_csv_rows
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+EXPORT_URL = "https://docs.google.com/spreadsheets/d/{spreadsheet_id}/export"
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+
+
+def _raise_if_rate_limited(error: httpx.HTTPError):
+    """429 không được nuốt như các lỗi khác: ném ra để bộ điều phối backoff và thử lại."""
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        retry_after = error.response.headers.get('retry-after')
+        raise SheetsRateLimitError(
+            str(error), float(retry_after) if retry_after and retry_after.isdigit() else None) from error
+
+
+class ServiceAccountTokenProvider:
+    """
+    Lấy access token cho service account bằng JWT bearer grant, gửi qua httpx.AsyncClient dùng chung.
+    Token được cache đến gần hết hạn; các coroutine cùng chờ một lần làm mới.
+    """
+
+    def __init__(self, key_path: str, scopes: List[str], http_client: httpx.AsyncClient):
+        try:
+            self._credentials = service_account.Credentials.from_service_account_file(key_path, scopes=scopes)
+        except FileNotFoundError:
+            logging.error(
+                f"Không tìm thấy file key tại: '{key_path}'. Vui lòng kiểm tra lại đường dẫn trong file settings.env.")
+            raise
+        self._scopes = scopes
+        self._http_client = http_client
+        self._access_token: Optional[str] = None
+        self._token_expires_at: float = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def service_account_email(self) -> str:
+        return self._credentials.service_account_email
+
+    async def get_token(self) -> str:
+        if self._access_token and time.time() < self._token_expires_at:
+            return self._access_token
+
+        async with self._lock:
+            if self._access_token and time.time() < self._token_expires_at:
+                return self._access_token
+
+            now = int(time.time())
+            assertion = jwt.encode(self._credentials.signer, {
+                "iss": self._credentials.service_account_email,
+                "scope": " ".join(self._scopes),
+                "aud": TOKEN_URI,
+                "iat": now,
+                "exp": now + 3600,
+            })
+            response = await self._http_client.post(TOKEN_URI, data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": assertion.decode() if isinstance(assertion, bytes) else assertion,
+            })
+            response.raise_for_status()
+            token_data = response.json()
+
+            self._access_token = token_data["access_token"]
+            self._token_expires_at = time.time() + token_data.get("expires_in", 3600) - 60  # Trừ 60s an toàn
+            logging.debug(f"New Google access token acquired for {self.service_account_email}.")
+            return self._access_token
+
+
+class AsyncGoogleSheetsClient:
+    """
+    Google Sheets client chạy thẳng trên event loop (httpx.AsyncClient dùng chung),
+    cùng bề mặt API với GoogleSheetsClient nhưng các hàm là async và có thể chạy song song.
+    """
+    # drive.readonly cần cho việc export tab ra CSV (stream_csv_rows)
+    SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
+              'https://www.googleapis.com/auth/drive.metadata.readonly',
+              'https://www.googleapis.com/auth/drive.readonly']
+
+    def __init__(self, key_path: str, http_client: httpx.AsyncClient):
+        self._http_client = http_client
+        self._token_provider = ServiceAccountTokenProvider(key_path, self.SCOPES, http_client)
+        self._sheet_gids: Dict[Tuple[str, str], int] = {}
+
+    async def _request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        token = await self._token_provider.get_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        response = await self._http_client.request(method, url, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _values_url(spreadsheet_id: str, suffix: str = "") -> str:
+        return f"{SHEETS_API_URL}/{spreadsheet_id}/values{suffix}"
+
+    async def get_data(self, spreadsheet_id: str, range_name: str) -> List[List[str]]:
+        try:
+            result = await self._request("GET", self._values_url(spreadsheet_id, f"/{quote(range_name, safe='')}"))
+            return result.get('values', [])
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Đã xảy ra lỗi API khi lấy dữ liệu: {error}")
+            return []
+
+    async def batch_update(self, spreadsheet_id: str, data: List[dict]):
+        try:
+            body = {'data': data, 'valueInputOption': 'USER_ENTERED'}
+            await self._request("POST", self._values_url(spreadsheet_id, ":batchUpdate"), json=body)
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Đã xảy ra lỗi API khi cập nhật dữ liệu: {error}")
+            # Cả batchUpdate bị từ chối: báo cho caller (bộ đệm ghi log cần biết để ghi lại)
+            raise SheetsRequestError(str(error)) from error
+
+    async def batch_get_data(self, spreadsheet_id: str, ranges: List[str],
+                             value_render_option: str = 'UNFORMATTED_VALUE') -> Dict[str, Any]:
+        """
+        Lấy dữ liệu từ nhiều dải ô trong cùng một spreadsheet.
+        Trả về một dictionary map từ dải ô (range) tới giá trị (value).
+        """
+        if not spreadsheet_id or not ranges:
+            return {}
+
+        try:
+            params = [('ranges', r) for r in ranges] + [('valueRenderOption', value_render_option)]
+            result = await self._request("GET", self._values_url(spreadsheet_id, ":batchGet"), params=params)
+            return normalize_value_ranges(result)
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
+            return {}
+
+    async def batch_get_values(self, spreadsheet_id: str, ranges: List[str],
+                               value_render_option: str = 'UNFORMATTED_VALUE') -> List[Optional[List[List[Any]]]]:
+        """
+        Như batch_get_data nhưng trả về giá trị theo đúng thứ tự `ranges`.
+        Ném SheetsRequestError khi API từ chối cả request.
+        """
+        if not spreadsheet_id or not ranges:
+            return []
+
+        try:
+            params = [('ranges', r) for r in ranges] + [('valueRenderOption', value_render_option)]
+            result = await self._request("GET", self._values_url(spreadsheet_id, ":batchGet"), params=params)
+            return ordered_value_ranges(result)
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
+            raise SheetsRequestError(str(error)) from error
+
+    async def get_spreadsheet_version(self, spreadsheet_id: str) -> Optional[str]:
+        """
+        Lấy số phiên bản (Drive 'version') của spreadsheet, tăng mỗi khi file thay đổi.
+        Trả về None nếu không lấy được (ví dụ Drive API chưa bật).
+        """
+        try:
+            result = await self._request("GET", f"{DRIVE_FILES_URL}/{spreadsheet_id}",
+                                         params={'fields': 'version', 'supportsAllDrives': 'true'})
+            return result.get('version')
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.warning(f"Không lấy được version của spreadsheet {spreadsheet_id}: {error}")
+            return None
+
+    async def _get_sheet_gid(self, spreadsheet_id: str, sheet_name: str) -> int:
+        key = (spreadsheet_id, sheet_name)
+        if key not in self._sheet_gids:
+            result = await self._request("GET", f"{SHEETS_API_URL}/{spreadsheet_id}",
+                                         params={'fields': 'sheets.properties(sheetId,title)'})
+            for sheet in result.get('sheets', []):
+                properties = sheet.get('properties', {})
+                self._sheet_gids[(spreadsheet_id, properties.get('title'))] = properties.get('sheetId')
+        if key not in self._sheet_gids:
+            raise ValueError(f"Sheet '{sheet_name}' not found in spreadsheet {spreadsheet_id}.")
+        return self._sheet_gids[key]
+
+    async def stream_csv_rows(self, spreadsheet_id: str, sheet_name: str) -> AsyncIterator[List[str]]:
+        """
+        Export một tab ra CSV và trả về từng hàng ngay khi dữ liệu về, không chờ tải xong.
+        Giá trị là chuỗi đã định dạng (giống values.get mặc định).
+        """
+        try:
+            gid = await self._get_sheet_gid(spreadsheet_id, sheet_name)
+            token = await self._token_provider.get_token()
+            async with self._http_client.stream(
+                    "GET", EXPORT_URL.format(spreadsheet_id=spreadsheet_id),
+                    params={'format': 'csv', 'gid': gid},
+                    headers={"Authorization": f"Bearer {token}"},
+                    follow_redirects=True
+            ) as response:
+                response.raise_for_status()
+                async for row in aiter_csv_rows(response.aiter_lines()):
+                    yield row
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi khi export CSV '{sheet_name}' từ {spreadsheet_id}: {error}")
+            raise
+
+    async def clear_sheet(self, spreadsheet_id: str, range_name: str):
+        """Xóa toàn bộ dữ liệu trong một dải ô hoặc toàn bộ sheet."""
+        try:
+            await self._request("POST", self._values_url(spreadsheet_id, f"/{quote(range_name, safe='')}:clear"),
+                                json={})
+            logging.info(f"Đã xóa thành công dữ liệu trong dải ô '{range_name}'.")
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi API khi xóa dữ liệu: {error}")
+            raise
+
+    async def update_data(self, spreadsheet_id: str, range_name: str, values: List[List[Any]]):
+        """Ghi đè dữ liệu vào một dải ô, bắt đầu từ ô đầu tiên của dải ô đó."""
+        try:
+            result = await self._request(
+                "PUT", self._values_url(spreadsheet_id, f"/{quote(range_name, safe='')}"),
+                params={'valueInputOption': 'USER_ENTERED'}, json={'values': values}
+            )
+            logging.info(f"{result.get('updatedCells')} ô đã được ghi tại dải ô '{range_name}'.")
+        except httpx.HTTPError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi API khi ghi dữ liệu: {error}")
+            raise
+
+    async def close(self):
+        pass
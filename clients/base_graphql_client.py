@@ -1,44 +1,57 @@
 import json
 import logging
 import re
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
 
 import httpx
+from pydantic import BaseModel
 from tenacity import stop_after_delay, retry, retry_if_exception, RetryCallState
 
 from clients.exceptions import GraphQLError, GraphQLClientError
+from clients.graphql_batcher import GraphQLBatcher, merge_operations, parse_operation, split_response
+from clients.rate_limiter import AdaptiveRateLimiter
+from utils.config import settings
+from utils.single_flight import SingleFlight
 
+ModelT = TypeVar("ModelT", bound=BaseModel)
 
-def _get_retry_after_seconds(retry_state: "RetryCallState") -> int:
-    exception = retry_state.outcome.exception()
-    if exception and isinstance(exception, GraphQLError):
-        try:
-            error_message = exception.errors[0].get('message', '')
 
-            match = re.search(r'Retry after (\d+)', error_message)
+def _retry_after_seconds(errors: Any) -> int:
+    try:
+        for error in errors:
+            match = re.search(r'Retry after (\d+)', error.get('message', ''))
             if match:
-                seconds = int(match.group(1))
-                logging.warning(f"Rate limit hit. Retrying after {seconds} seconds...")
-                return seconds
-        except (IndexError, KeyError, TypeError):
-            pass
-    logging.warning("Rate limit hit. Retrying after 5 seconds (default)...")
+                return int(match.group(1))
+    except (AttributeError, TypeError):
+        pass
     return 5
 
 
+def _has_rate_limit_error(errors: Any) -> bool:
+    try:
+        return any('Too Many Requests' in error.get('message', '') for error in errors)
+    except (AttributeError, TypeError):
+        return False
+
+
+def _wait_before_retry(retry_state: "RetryCallState") -> int:
+    # Thời gian chờ thực sự (Retry-After) do AdaptiveRateLimiter áp dụng chung cho mọi worker
+    exception = retry_state.outcome.exception()
+    if isinstance(exception, GraphQLError):
+        logging.warning(f"Rate limit hit. Retrying after {_retry_after_seconds(exception.errors)} seconds...")
+    return 0
+
+
 def _is_rate_limit_error(exception: BaseException) -> bool:
     if isinstance(exception, GraphQLError):
-        try:
-            error_message = exception.errors[0].get('message', '')
-            return 'Too Many Requests' in error_message
-        except (IndexError, KeyError, TypeError):
-            return False
+        return _has_rate_limit_error(exception.errors)
     return False
 
 
 class BaseGraphQLClient:
 
-    def __init__(self, graphql_url: str, client: httpx.AsyncClient, auth_handler: Optional[Any] = None):
+    def __init__(self, graphql_url: str, client: httpx.AsyncClient, auth_handler: Optional[Any] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None):
         self.logger = logging.getLogger(self.__class__.__name__)
         if not graphql_url:
             raise ValueError("GraphQL URL is required.")
@@ -47,36 +60,111 @@ class BaseGraphQLClient:
         self.auth_handler = auth_handler
 
         self._client = client
+        self._query_timeout = settings.http_timeout(settings.ENEBA_QUERY_TIMEOUT)
+        self._mutation_timeout = settings.http_timeout(settings.ENEBA_MUTATION_TIMEOUT)
+        # Gộp các operation đồng thời thành một request bằng alias (GRAPHQL_BATCH_*)
+        self._batcher = GraphQLBatcher(
+            send=self._send,
+            max_size=settings.GRAPHQL_BATCH_MAX_SIZE,
+            max_wait=settings.GRAPHQL_BATCH_MAX_WAIT_MS / 1000,
+        ) if settings.GRAPHQL_BATCH_ENABLED else None
+        self._single_flight = SingleFlight()
+        # Giới hạn tốc độ dùng chung: gặp 429 thì mọi request đều tạm dừng
+        self._rate_limiter = rate_limiter or AdaptiveRateLimiter.from_settings()
+
+    async def execute(
+            self,
+            query: str,
+            variables: Optional[Dict[str, Any]] = None,
+            response_model: Optional[Type[ModelT]] = None,
+            batch: bool = True
+    ) -> Union[Dict[str, Any], ModelT]:
+        """
+        Args:
+            response_model: nếu có, response được validate thẳng từ bytes thành model này
+                (không qua dict) khi request không bị gộp.
+            batch: False để gửi riêng (response lớn như S_competition không được lợi gì khi gộp).
+        """
+        operation = parse_operation(query)
+        if operation is None or operation.kind != "query":
+            return await self._execute(query, variables, response_model, batch)
+
+        # Các query giống hệt nhau (cùng document + biến) đang chạy đồng thời chỉ gửi một lần
+        key = (query, json.dumps(variables or {}, sort_keys=True, default=str), response_model)
+        return await self._single_flight.do(key, lambda: self._execute(query, variables, response_model, batch))
 
     @retry(
         stop=stop_after_delay(60),
         retry=retry_if_exception(_is_rate_limit_error),
-        wait=_get_retry_after_seconds
+        wait=_wait_before_retry
     )
-    async def execute(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async def _execute(
+            self,
+            query: str,
+            variables: Optional[Dict[str, Any]] = None,
+            response_model: Optional[Type[ModelT]] = None,
+            batch: bool = True
+    ) -> Union[Dict[str, Any], ModelT]:
+        if self._batcher and batch:
+            response_json = await self._batcher.submit(query, variables)
+        else:
+            content = await self._post(query, variables or {})
+            # Kiểm tra "errors" trên bytes: response bình thường chỉ được parse một lần
+            if b'"errors"' not in content:
+                self._rate_limiter.on_success()
+                return response_model.model_validate_json(content) if response_model else json.loads(content)
+            response_json = json.loads(content)
+            self._observe_rate_limit(response_json.get("errors"))
+
+        if response_json.get("errors"):
+            raise GraphQLError(response_json["errors"])
+        return response_model.model_validate(response_json) if response_model else response_json
+
+    async def execute_batch(self, query: str, variables_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Gửi cùng một operation với nhiều bộ biến trong một request (alias `b{i}_`), không retry.
+
+        Returns:
+            response riêng (data + errors) của từng bộ biến, theo thứ tự; lỗi của alias nào chỉ nằm ở alias đó.
+        """
+        operation = parse_operation(query)
+        if operation is None:
+            raise ValueError("Operation cannot be batched.")
+        if len(variables_list) == 1:
+            return [await self._send(query, variables_list[0])]
+        document, merged_variables, keys = merge_operations([(operation, variables) for variables in variables_list])
+        return split_response(await self._send(document, merged_variables), keys)
+
+    async def _send(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Gửi một document lên server, trả về JSON (có thể chứa "errors" để caller tách theo alias)."""
+        response_json = json.loads(await self._post(query, variables))
+        self._observe_rate_limit(response_json.get("errors"))
+        return response_json
+
+    async def _post(self, query: str, variables: Dict[str, Any]) -> bytes:
+        """Gửi một document lên server, trả về body (bytes) chưa parse."""
         headers = {"Content-Type": "application/json"}
         headers.update({"X-Proxy-Secret": "embeiuquadi"})
         if self.auth_handler:
-            auth_headers = self.auth_handler.get_auth_headers()
+            auth_headers = await self.auth_handler.get_auth_headers()
             headers.update(auth_headers)
 
-        payload = {"query": query, "variables": variables or {}}
+        payload = {"query": query, "variables": variables}
 
+        await self._rate_limiter.acquire()
         try:
             self.logger.debug("Executing GraphQL query...")
-            response = await self._client.post(self.graphql_url, json=payload, headers=headers, timeout=30)
+            timeout = self._mutation_timeout if query.lstrip().startswith("mutation") else self._query_timeout
+            response = await self._client.post(self.graphql_url, json=payload, headers=headers, timeout=timeout)
             response.raise_for_status()
-
-            response_json = response.json()
-            if "errors" in response_json:
-                raise GraphQLError(response_json["errors"])
-            return response_json
+            return response.content
 
         except httpx.HTTPStatusError as e:
             error_body = e.response.text
             try:
                 error_json = json.loads(error_body)
                 if "errors" in error_json:
+                    self._observe_rate_limit(error_json["errors"])
                     raise GraphQLError(error_json["errors"])
             except json.JSONDecodeError:
                 pass
@@ -85,6 +173,25 @@ class BaseGraphQLClient:
             self.logger.error(f"A network error occurred: {e}")
             raise GraphQLClientError("Network Error") from e
 
+    def _observe_rate_limit(self, errors: Any):
+        if errors and _has_rate_limit_error(errors):
+            self._rate_limiter.on_rate_limited(_retry_after_seconds(errors))
+        else:
+            self._rate_limiter.on_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_limiter": self._rate_limiter.stats(),
+            "single_flight": self._single_flight.stats(),
+            "batching": self._batcher.stats() if self._batcher else None,
+        }
+
+    def reset_stats(self):
+        self._rate_limiter.reset_stats()
+        self._single_flight.reset_stats()
+        if self._batcher:
+            self._batcher.reset_stats()
+
     async def close(self):
         self.logger.info("Closing auth handler (client is managed externally).")
         if self.auth_handler and hasattr(self.auth_handler, 'close'):
@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 
 class APIError(Exception):
@@ -19,3 +19,16 @@ class GraphQLError(GraphQLClientError):
     def __init__(self, errors: Dict[str, Any]):
         self.errors = errors
         super().__init__(f"GraphQL API returned errors: {errors}")
+
+
+class SheetsRequestError(APIError):
+    """Raised when Google Sheets API rejects a request (non-429), e.g. 400 for an invalid range."""
+    pass
+
+
+class SheetsRateLimitError(APIError):
+    """Raised when Google Sheets API returns 429 (quota exceeded)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        self.retry_after = retry_after
+        super().__init__(message)
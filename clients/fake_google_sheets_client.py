@@ -0,0 +1,238 @@
+# clients/fake_google_sheets_client.py
+import asyncio
+import csv
+import logging
+import os
+import random
+import re
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+
+from clients.exceptions import SheetsRateLimitError, SheetsRequestError
+from clients.google_sheets_client import normalize_value_ranges, ordered_value_ranges
+from models.sheet_models import _col_to_index, _index_to_col
+
+_A1_RE = re.compile(r"^(?P<col>[A-Z]*)(?P<row>\d*)$", re.IGNORECASE)
+
+
+def _split_range(range_name: str) -> Tuple[str, str]:
+    if '!' not in range_name:
+        return range_name.strip("'"), ""
+    sheet_name, cell_range = range_name.rsplit('!', 1)
+    return sheet_name.strip("'"), cell_range
+
+
+def _parse_a1(cell_range: str) -> Tuple[int, int, Optional[int], Optional[int]]:
+    """
+    Parse một dải A1 (không kèm tên sheet) thành (row0, col0, row1, col1), chỉ số từ 0, bao gồm hai đầu.
+    row1/col1 = None nghĩa là không giới hạn (ví dụ 'A:A', '1:3', hoặc cả sheet).
+    """
+    if not cell_range:
+        return 0, 0, None, None
+    start, _, end = cell_range.partition(':')
+    start_match, end_match = _A1_RE.match(start), _A1_RE.match(end or start)
+    if not start_match or not end_match:
+        raise ValueError(f"Invalid A1 range: {cell_range}")
+
+    def _bounds(match, default_row, default_col):
+        col = _col_to_index(match.group('col')) if match.group('col') else default_col
+        row = int(match.group('row')) - 1 if match.group('row') else default_row
+        return row, col
+
+    row0, col0 = _bounds(start_match, 0, 0)
+    row1, col1 = _bounds(end_match, None, None)
+    if not end:
+        row1, col1 = row0, col0
+    return row0, col0, row1, col1
+
+
+def _to_unformatted(value: str) -> Any:
+    """Mô phỏng valueRenderOption=UNFORMATTED_VALUE: chuỗi số được trả về dạng số."""
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class FakeGoogleSheetsClient:
+    """
+    Google Sheets giả lập trong bộ nhớ (tùy chọn lưu bằng CSV: <data_dir>/<spreadsheet_id>/<sheet>.csv),
+    cùng bề mặt API async với AsyncGoogleSheetsClient. Dùng để benchmark/chạy thử không cần spreadsheet thật.
+
+    Args:
+        data_dir: thư mục CSV để nạp/lưu dữ liệu (None = chỉ trong bộ nhớ).
+        latency: độ trễ giả lập cho mỗi request (giây).
+        quota_error_rate: xác suất một request bị trả về 429.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, latency: float = 0.0, quota_error_rate: float = 0.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.data_dir = data_dir
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.calls: Counter = Counter()
+
+        self._sheets: Dict[str, Dict[str, List[List[str]]]] = {}
+        self._versions: Counter = Counter()
+
+    # --- Lưu trữ ---
+
+    def set_sheet(self, spreadsheet_id: str, sheet_name: str, rows: List[List[Any]]):
+        self._sheets.setdefault(spreadsheet_id, {})[sheet_name] = [
+            ["" if value is None else str(value) for value in row] for row in rows
+        ]
+        self._versions[spreadsheet_id] += 1
+
+    def get_sheet(self, spreadsheet_id: str, sheet_name: str) -> List[List[str]]:
+        sheets = self._sheets.setdefault(spreadsheet_id, {})
+        if sheet_name not in sheets:
+            sheets[sheet_name] = self._load_csv(spreadsheet_id, sheet_name)
+        return sheets[sheet_name]
+
+    def _csv_path(self, spreadsheet_id: str, sheet_name: str) -> str:
+        return os.path.join(self.data_dir, spreadsheet_id, f"{sheet_name}.csv")
+
+    def _load_csv(self, spreadsheet_id: str, sheet_name: str) -> List[List[str]]:
+        if not self.data_dir or not os.path.exists(self._csv_path(spreadsheet_id, sheet_name)):
+            return []
+        with open(self._csv_path(spreadsheet_id, sheet_name), newline='', encoding='utf-8') as f:
+            return [row for row in csv.reader(f)]
+
+    def save(self):
+        """Ghi toàn bộ dữ liệu trong bộ nhớ ra thư mục CSV."""
+        if not self.data_dir:
+            return
+        for spreadsheet_id, sheets in self._sheets.items():
+            os.makedirs(os.path.join(self.data_dir, spreadsheet_id), exist_ok=True)
+            for sheet_name, rows in sheets.items():
+                with open(self._csv_path(spreadsheet_id, sheet_name), 'w', newline='', encoding='utf-8') as f:
+                    csv.writer(f).writerows(rows)
+
+    # --- Mô phỏng API ---
+
+    async def _simulate(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.quota_error_rate and random.random() < self.quota_error_rate:
+            raise SheetsRateLimitError(f"Fake quota exceeded on {method}", retry_after=None)
+
+    def _read_range(self, spreadsheet_id: str, range_name: str) -> Tuple[str, List[List[str]]]:
+        sheet_name, cell_range = _split_range(range_name)
+        grid = self.get_sheet(spreadsheet_id, sheet_name)
+        row0, col0, row1, col1 = _parse_a1(cell_range)
+
+        values = []
+        for row in grid[row0:None if row1 is None else row1 + 1]:
+            cells = row[col0:None if col1 is None else col1 + 1]
+            while cells and cells[-1] == "":
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+
+        last_row = row1 if row1 is not None else max(len(grid) - 1, row0)
+        last_col = col1 if col1 is not None else max(max((len(r) for r in grid), default=1) - 1, col0)
+        response_range = f"{_index_to_col(col0)}{row0 + 1}"
+        if (last_row, last_col) != (row0, col0):
+            response_range += f":{_index_to_col(last_col)}{last_row + 1}"
+        return f"'{sheet_name}'!{response_range}", values
+
+    def _write_range(self, spreadsheet_id: str, range_name: str, values: List[List[Any]]):
+        sheet_name, cell_range = _split_range(range_name)
+        grid = self.get_sheet(spreadsheet_id, sheet_name)
+        row0, col0, _, _ = _parse_a1(cell_range)
+        for r, row_values in enumerate(values):
+            while len(grid) <= row0 + r:
+                grid.append([])
+            row = grid[row0 + r]
+            for c, value in enumerate(row_values):
+                while len(row) <= col0 + c:
+                    row.append("")
+                row[col0 + c] = "" if value is None else str(value)
+        self._versions[spreadsheet_id] += 1
+
+    async def get_data(self, spreadsheet_id: str, range_name: str) -> List[List[str]]:
+        await self._simulate("get_data")
+        return self._read_range(spreadsheet_id, range_name)[1]
+
+    def _batch_get(self, spreadsheet_id: str, ranges: List[str], value_render_option: str) -> Dict[str, Any]:
+        """Response batchGet giả lập; ValueError khi có range sai (giống API thật: hỏng cả request)."""
+        value_ranges = []
+        for range_name in ranges:
+            response_range, values = self._read_range(spreadsheet_id, range_name)
+            value_range = {'range': response_range}
+            if values:
+                if value_render_option == 'UNFORMATTED_VALUE':
+                    values = [[_to_unformatted(v) for v in row] for row in values]
+                value_range['values'] = values
+            value_ranges.append(value_range)
+        return {'valueRanges': value_ranges}
+
+    async def batch_get_data(self, spreadsheet_id: str, ranges: List[str],
+                             value_render_option: str = 'UNFORMATTED_VALUE') -> Dict[str, Any]:
+        if not spreadsheet_id or not ranges:
+            return {}
+        await self._simulate("batch_get_data")
+        try:
+            return normalize_value_ranges(self._batch_get(spreadsheet_id, ranges, value_render_option))
+        except ValueError as error:
+            logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
+            return {}
+
+    async def batch_get_values(self, spreadsheet_id: str, ranges: List[str],
+                               value_render_option: str = 'UNFORMATTED_VALUE') -> List[Optional[List[List[Any]]]]:
+        if not spreadsheet_id or not ranges:
+            return []
+        await self._simulate("batch_get_data")
+        try:
+            return ordered_value_ranges(self._batch_get(spreadsheet_id, ranges, value_render_option))
+        except ValueError as error:
+            logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
+            raise SheetsRequestError(str(error)) from error
+
+    async def batch_update(self, spreadsheet_id: str, data: List[dict]):
+        await self._simulate("batch_update")
+        try:
+            # Giống API thật: kiểm tra mọi range trước, một range sai làm hỏng cả request
+            for item in data:
+                _parse_a1(_split_range(item['range'])[1])
+        except ValueError as error:
+            raise SheetsRequestError(str(error)) from error
+        for item in data:
+            self._write_range(spreadsheet_id, item['range'], item['values'])
+
+    async def update_data(self, spreadsheet_id: str, range_name: str, values: List[List[Any]]):
+        await self._simulate("update_data")
+        self._write_range(spreadsheet_id, range_name, values)
+
+    async def clear_sheet(self, spreadsheet_id: str, range_name: str):
+        await self._simulate("clear_sheet")
+        sheet_name, cell_range = _split_range(range_name)
+        grid = self.get_sheet(spreadsheet_id, sheet_name)
+        row0, col0, row1, col1 = _parse_a1(cell_range)
+        for row in grid[row0:None if row1 is None else row1 + 1]:
+            for c in range(col0, len(row) if col1 is None else min(col1 + 1, len(row))):
+                row[c] = ""
+        self._versions[spreadsheet_id] += 1
+
+    async def stream_csv_rows(self, spreadsheet_id: str, sheet_name: str) -> AsyncIterator[List[str]]:
+        """Mô phỏng export CSV: các hàng được trả về dần dần, mỗi hàng đủ chiều rộng của tab."""
+        await self._simulate("stream_csv_rows")
+        grid = self.get_sheet(spreadsheet_id, sheet_name)
+        width = max((len(row) for row in grid), default=0)
+        for i, row in enumerate(grid):
+            if i % 500 == 0:
+                await asyncio.sleep(0)
+            yield row + [""] * (width - len(row))
+
+    async def get_spreadsheet_version(self, spreadsheet_id: str) -> Optional[str]:
+        await self._simulate("get_spreadsheet_version")
+        return str(self._versions[spreadsheet_id])
+
+    async def close(self):
+        self.save()
@@ -1,19 +1,56 @@
 # clients/google_sheets_client.py
+import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from clients.exceptions import SheetsRateLimitError, SheetsRequestError
+
+
+def _raise_if_rate_limited(error: HttpError):
+    """429 không được nuốt như các lỗi khác: ném ra để bộ điều phối backoff và thử lại."""
+    if error.resp is not None and error.resp.status == 429:
+        retry_after = error.resp.get('retry-after')
+        raise SheetsRateLimitError(
+            str(error), float(retry_after) if retry_after and retry_after.isdigit() else None) from error
+
+
+def normalize_value_ranges(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Map range trả về của batchGet (dạng 'Sheet'!A1:B2) tới giá trị của nó."""
+    value_map = {}
+    for value_range in result.get('valueRanges', []):
+        response_range = value_range.get('range')
+        if not response_range:
+            continue
+
+        sheet_name, cell_range = response_range.rsplit('!', 1)
+        normalized_sheet_name = sheet_name.strip("'")
+        normalized_key = f"'{normalized_sheet_name}'!{cell_range}"
+
+        values = value_range.get('values')
+
+        value_map[normalized_key] = values
+
+    return value_map
+
+
+def ordered_value_ranges(result: Dict[str, Any]) -> List[Optional[List[List[Any]]]]:
+    """Giá trị của từng valueRange theo đúng thứ tự các dải ô đã gửi cho batchGet."""
+    return [value_range.get('values') for value_range in result.get('valueRanges', [])]
+
 
 class GoogleSheetsClient:
-    SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+    SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
+              'https://www.googleapis.com/auth/drive.metadata.readonly']
 
     def __init__(self, key_path: str):
         try:
             creds = service_account.Credentials.from_service_account_file(key_path, scopes=self.SCOPES)
             self.service = build('sheets', 'v4', credentials=creds)
+            self.drive_service = build('drive', 'v3', credentials=creds)
             # logging.info("Đã kết nối thành công tới Google Sheets API.")
         except FileNotFoundError:
             logging.error(
@@ -32,6 +69,7 @@ class GoogleSheetsClient:
             # logging.info(f"Đã lấy thành công {len(values)} hàng từ dải ô '{range_name}'.")
             return values
         except HttpError as error:
+            _raise_if_rate_limited(error)
             logging.error(f"Đã xảy ra lỗi API khi lấy dữ liệu: {error}")
             return []
 
@@ -43,9 +81,13 @@ class GoogleSheetsClient:
             ).execute()
             # logging.info(f"{result.get('totalUpdatedCells')} ô đã được cập nhật.")
         except HttpError as error:
+            _raise_if_rate_limited(error)
             logging.error(f"Đã xảy ra lỗi API khi cập nhật dữ liệu: {error}")
+            # Cả batchUpdate bị từ chối: báo cho caller (bộ đệm ghi log cần biết để ghi lại)
+            raise SheetsRequestError(str(error)) from error
 
-    def batch_get_data(self, spreadsheet_id: str, ranges: List[str]) -> Dict[str, Any]:
+    def batch_get_data(self, spreadsheet_id: str, ranges: List[str],
+                       value_render_option: str = 'UNFORMATTED_VALUE') -> Dict[str, Any]:
         """
         Lấy dữ liệu từ nhiều dải ô trong cùng một spreadsheet.
         Trả về một dictionary map từ dải ô (range) tới giá trị (value).
@@ -55,28 +97,51 @@ class GoogleSheetsClient:
 
         try:
             result = self.service.spreadsheets().values().batchGet(
-                spreadsheetId=spreadsheet_id, ranges=ranges, valueRenderOption='UNFORMATTED_VALUE'
+                spreadsheetId=spreadsheet_id, ranges=ranges, valueRenderOption=value_render_option
             ).execute()
 
-            value_map = {}
-            for value_range in result.get('valueRanges', []):
-                response_range = value_range.get('range')
-                if not response_range:
-                    continue
+            return normalize_value_ranges(result)
 
-                sheet_name, cell_range = response_range.split('!')
-                normalized_sheet_name = sheet_name.strip("'")
-                normalized_key = f"'{normalized_sheet_name}'!{cell_range}"
-
-                values = value_range.get('values')
+        except HttpError as error:
+            _raise_if_rate_limited(error)
+            logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
+            return {}
 
-                value_map[normalized_key] = values
+    def batch_get_values(self, spreadsheet_id: str, ranges: List[str],
+                         value_render_option: str = 'UNFORMATTED_VALUE') -> List[Optional[List[List[Any]]]]:
+        """
+        Như batch_get_data nhưng trả về giá trị theo đúng thứ tự `ranges`: nhiều dải ô khác nhau
+        (ví dụ 'S'!B2 và 'S'!B2:B2) có thể ứng với cùng một range trả về nên không map theo range được.
+        Ném SheetsRequestError khi API từ chối cả request.
+        """
+        if not spreadsheet_id or not ranges:
+            return []
 
-            return value_map
+        try:
+            result = self.service.spreadsheets().values().batchGet(
+                spreadsheetId=spreadsheet_id, ranges=ranges, valueRenderOption=value_render_option
+            ).execute()
+            return ordered_value_ranges(result)
 
         except HttpError as error:
+            _raise_if_rate_limited(error)
             logging.error(f"Lỗi API khi batchGet dữ liệu từ {spreadsheet_id}: {error}")
-            return {}
+            raise SheetsRequestError(str(error)) from error
+
+    def get_spreadsheet_version(self, spreadsheet_id: str) -> Optional[str]:
+        """
+        Lấy số phiên bản (Drive 'version') của spreadsheet, tăng mỗi khi file thay đổi.
+        Trả về None nếu không lấy được (ví dụ Drive API chưa bật).
+        """
+        try:
+            result = self.drive_service.files().get(
+                fileId=spreadsheet_id, fields='version', supportsAllDrives=True
+            ).execute()
+            return result.get('version')
+        except HttpError as error:
+            _raise_if_rate_limited(error)
+            logging.warning(f"Không lấy được version của spreadsheet {spreadsheet_id}: {error}")
+            return None
 
     def clear_sheet(self, spreadsheet_id: str, range_name: str):
         """Xóa toàn bộ dữ liệu trong một dải ô hoặc toàn bộ sheet."""
@@ -88,6 +153,7 @@ class GoogleSheetsClient:
             ).execute()
             logging.info(f"Đã xóa thành công dữ liệu trong dải ô '{range_name}'.")
         except HttpError as error:
+            _raise_if_rate_limited(error)
             logging.error(f"Lỗi API khi xóa dữ liệu: {error}")
             raise
 
@@ -103,5 +169,48 @@ class GoogleSheetsClient:
             ).execute()
             logging.info(f"{result.get('updatedCells')} ô đã được ghi tại dải ô '{range_name}'.")
         except HttpError as error:
+            _raise_if_rate_limited(error)
             logging.error(f"Lỗi API khi ghi dữ liệu: {error}")
             raise
+
+
+class ThreadedGoogleSheetsClient:
+    """
+    Bọc GoogleSheetsClient (đồng bộ) thành API async.
+    Mỗi lời gọi chạy trong asyncio.to_thread; transport httplib2 không thread-safe
+    nên các lời gọi được tuần tự hóa bằng một lock.
+    """
+
+    def __init__(self, client: GoogleSheetsClient):
+        self._client = client
+        self._lock = asyncio.Lock()
+
+    async def _call(self, func, *args):
+        async with self._lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def get_data(self, spreadsheet_id: str, range_name: str) -> List[List[str]]:
+        return await self._call(self._client.get_data, spreadsheet_id, range_name)
+
+    async def batch_update(self, spreadsheet_id: str, data: List[dict]):
+        return await self._call(self._client.batch_update, spreadsheet_id, data)
+
+    async def batch_get_data(self, spreadsheet_id: str, ranges: List[str],
+                             value_render_option: str = 'UNFORMATTED_VALUE') -> Dict[str, Any]:
+        return await self._call(self._client.batch_get_data, spreadsheet_id, ranges, value_render_option)
+
+    async def batch_get_values(self, spreadsheet_id: str, ranges: List[str],
+                               value_render_option: str = 'UNFORMATTED_VALUE') -> List[Optional[List[List[Any]]]]:
+        return await self._call(self._client.batch_get_values, spreadsheet_id, ranges, value_render_option)
+
+    async def get_spreadsheet_version(self, spreadsheet_id: str) -> Optional[str]:
+        return await self._call(self._client.get_spreadsheet_version, spreadsheet_id)
+
+    async def clear_sheet(self, spreadsheet_id: str, range_name: str):
+        return await self._call(self._client.clear_sheet, spreadsheet_id, range_name)
+
+    async def update_data(self, spreadsheet_id: str, range_name: str, values: List[List[Any]]):
+        return await self._call(self._client.update_data, spreadsheet_id, range_name, values)
+
+    async def close(self):
+        pass
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+_OPERATION_RE = re.compile(
+    r"^\s*(?P<kind>query|mutation)\s*(?P<name>\w+)?\s*(?:\((?P<variables>[^)]*)\))?\s*\{(?P<body>.*)\}\s*$",
+    re.DOTALL,
+)
+_NAME_RE = re.compile(r"[_A-Za-z]\w*")
+_VARIABLE_RE = re.compile(r"\$(\w+)")
+_ALIAS_PREFIX_RE = re.compile(r"^b(\d+)_")
+
+Sender = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class GraphQLOperation:
+    kind: str
+    variables: str
+    body: str
+
+
+@lru_cache(maxsize=128)
+def parse_operation(query: str) -> Optional[GraphQLOperation]:
+    """
+    Tách một document chỉ có một operation (không fragment) thành kind / khai báo biến / selection gốc.
+    Trả về None nếu document không gộp được, khi đó request được gửi riêng như cũ.
+    """
+    if "fragment " in query:
+        return None
+    match = _OPERATION_RE.match(query)
+    if not match:
+        return None
+    return GraphQLOperation(match.group('kind'), (match.group('variables') or "").strip(), match.group('body'))
+
+
+def _skip_string(text: str, i: int) -> int:
+    """Vị trí ngay sau chuỗi "..." bắt đầu tại i."""
+    i += 1
+    while i < len(text) and text[i] != '"':
+        i += 2 if text[i] == '\\' else 1
+    return i + 1
+
+
+def _alias_root_fields(body: str, prefix: str) -> Tuple[str, List[str]]:
+    """
+    Thêm tiền tố vào alias của các field gốc: `S_stock(...)` -> `b0_S_stock: S_stock(...)`,
+    `x: S_stock(...)` -> `b0_x: S_stock(...)`.
+
+    Returns:
+        (selection đã alias, danh sách key gốc trong `data` của response)
+    """
+    out: List[str] = []
+    keys: List[str] = []
+    depth = 0
+    i = 0
+    while i < len(body):
+        c = body[i]
+        if c == '"':
+            end = _skip_string(body, i)
+            out.append(body[i:end])
+            i = end
+            continue
+        if c in '{(':
+            depth += 1
+        elif c in '})':
+            depth -= 1
+        elif depth == 0 and (c.isalpha() or c == '_'):
+            name_end = _NAME_RE.match(body, i).end()
+            name = body[i:name_end]
+            j = name_end
+            while j < len(body) and body[j].isspace():
+                j += 1
+            keys.append(name)
+            if j < len(body) and body[j] == ':':
+                # Đã có alias: thêm tiền tố cho alias rồi chép nguyên tên field
+                k = j + 1
+                while k < len(body) and body[k].isspace():
+                    k += 1
+                field_end = _NAME_RE.match(body, k).end()
+                out.append(prefix + body[i:field_end])
+                i = field_end
+            else:
+                out.append(f"{prefix}{name}: {name}")
+                i = name_end
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out), keys
+
+
+def merge_operations(
+        operations: List[Tuple[GraphQLOperation, Dict[str, Any]]]
+) -> Tuple[str, Dict[str, Any], List[List[str]]]:
+    """
+    Gộp nhiều operation cùng kind thành một document. Operation thứ i dùng tiền tố `b{i}_`
+    cho cả alias field gốc lẫn tên biến.
+
+    Returns:
+        (document, biến đã đổi tên, key gốc của từng operation)
+    """
+    variable_defs: List[str] = []
+    selections: List[str] = []
+    merged_variables: Dict[str, Any] = {}
+    keys_per_operation: List[List[str]] = []
+    for index, (operation, variables) in enumerate(operations):
+        prefix = f"b{index}_"
+        if operation.variables:
+            variable_defs.append(_VARIABLE_RE.sub(rf"${prefix}\1", operation.variables))
+        body = _VARIABLE_RE.sub(rf"${prefix}\1", operation.body)
+        aliased, keys = _alias_root_fields(body, prefix)
+        selections.append(aliased)
+        keys_per_operation.append(keys)
+        for name, value in (variables or {}).items():
+            merged_variables[prefix + name] = value
+
+    kind = operations[0][0].kind
+    header = f"{kind} Batched" + (f"({', '.join(variable_defs)})" if variable_defs else "")
+    document = header + " {" + "\n".join(selections) + "}"
+    return document, merged_variables, keys_per_operation
+
+
+def split_response(response: Dict[str, Any], keys_per_operation: List[List[str]]) -> List[Dict[str, Any]]:
+    """Tách response của document đã gộp thành response riêng (data + errors) cho từng operation."""
+    data = response.get("data") or {}
+    results: List[Dict[str, Any]] = []
+    for index, keys in enumerate(keys_per_operation):
+        prefix = f"b{index}_"
+        results.append({"data": {key: data.get(prefix + key) for key in keys} if data else None})
+
+    for error in response.get("errors") or []:
+        path = error.get("path") or []
+        match = _ALIAS_PREFIX_RE.match(str(path[0])) if path else None
+        if match and int(match.group(1)) < len(results):
+            index = int(match.group(1))
+            local_error = dict(error, path=[path[0][len(match.group(0)):], *path[1:]])
+            results[index].setdefault("errors", []).append(local_error)
+        else:
+            # Lỗi không gắn với field nào (rate limit, lỗi xác thực...): áp dụng cho mọi operation
+            for result in results:
+                result.setdefault("errors", []).append(error)
+    return results
+
+
+class GraphQLBatcher:
+    """
+    Gom các operation được gọi đồng thời trong `max_wait` giây (tối đa `max_size` operation)
+    thành một request duy nhất bằng alias, rồi trả kết quả/lỗi về đúng caller.
+    Chỉ gom các operation thuộc `kinds` (mặc định chỉ query); query và mutation được gom riêng.
+    """
+
+    def __init__(self, send: Sender, max_size: int, max_wait: float, kinds: Tuple[str, ...] = ("query",)):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._send = send
+        self.kinds = kinds
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[str, GraphQLOperation, Dict[str, Any], asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+        self.requests = 0
+        self.operations = 0
+
+    async def submit(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        operation = parse_operation(query)
+        if operation is None or operation.kind not in self.kinds:
+            self.requests += 1
+            self.operations += 1
+            return await self._send(query, variables or {})
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(operation.kind, [])
+        pending.append((query, operation, variables or {}, future))
+
+        if len(pending) >= self.max_size:
+            self._start_flush(operation.kind)
+        elif operation.kind not in self._timers:
+            self._timers[operation.kind] = loop.call_later(self.max_wait, self._start_flush, operation.kind)
+        return await future
+
+    def _start_flush(self, kind: str):
+        timer = self._timers.pop(kind, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(kind, [])
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, batch: List[Tuple[str, GraphQLOperation, Dict[str, Any], asyncio.Future]]):
+        self.requests += 1
+        self.operations += len(batch)
+        try:
+            if len(batch) == 1:
+                query, _, variables, future = batch[0]
+                results = [await self._send(query, variables)]
+            else:
+                document, merged_variables, keys = merge_operations([(op, var) for _, op, var, _ in batch])
+                self.logger.debug(f"Sending {len(batch)} batched GraphQL operations in one request.")
+                results = split_response(await self._send(document, merged_variables), keys)
+        except Exception as e:
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (*_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        return {"operations": self.operations, "requests": self.requests}
+
+    def reset_stats(self):
+        self.requests = 0
+        self.operations = 0
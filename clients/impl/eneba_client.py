@@ -1,11 +1,15 @@
 import logging
+from typing import List, Optional
 from uuid import UUID
 
 import httpx
 
 from clients.base_graphql_client import BaseGraphQLClient
+from clients.exceptions import GraphQLError
 from clients.impl.eneba_query import S_PRODUCTS_BY_SLUGS_QUERY, S_COMPETITION_QUERY, S_CALCULATE_PRICE_QUERY, \
+    S_COMPETITION_PAGE_QUERY, \
     S_UPDATE_AUCTION_MUTATION, S_STOCK_QUERY
+from clients.price_update_batcher import PriceUpdateBatcher
 from logic.auth import EnebaAuthHandler
 from models.eneba_models import SProductsGraphQLResponse, SCompetitionGraphQLResponse, SCalculatePriceGraphQLResponse, \
     PriceInput, CalculatePriceInput, UpdateAuctionInput, SUpdateAuctionGraphQLResponse, SStockGraphQLResponse
@@ -20,17 +24,41 @@ class EnebaClient:
         self.logger = logging.getLogger(self.__class__.__name__)
         self.logger.info("Initializing EnebaClient for proxy...")
 
-        auth_handler = EnebaAuthHandler()
+        self._auth_handler = EnebaAuthHandler(http_client=http_client)
 
         self._client = BaseGraphQLClient(
             graphql_url=graphql_url,
             client=http_client,
-            auth_handler=auth_handler
+            auth_handler=self._auth_handler
         )
+        # Cập nhật giá của các worker được gom thành mutation alias (PRICE_UPDATE_BATCH_*).
+        # Mỗi worker chỉ chờ một lần cập nhật, nên lô đủ khi mọi worker đã gửi: gửi ngay, không chờ hết max_wait
+        # (WORKERS = 1: mỗi lần cập nhật được gửi ngay như trước)
+        self._price_update_batcher = PriceUpdateBatcher(
+            mutation=S_UPDATE_AUCTION_MUTATION,
+            execute_batch=self._client.execute_batch,
+            max_size=min(settings.PRICE_UPDATE_BATCH_MAX_SIZE, int(settings.WORKERS or 1)),
+            max_wait=settings.PRICE_UPDATE_BATCH_MAX_WAIT_MS / 1000,
+            max_retries=settings.PRICE_UPDATE_MAX_RETRIES,
+        ) if settings.PRICE_UPDATE_BATCH_ENABLED else None
 
     async def close(self):
         await self._client.close()
 
+    async def warm_up(self):
+        """Lấy token trước khi vào vòng xử lý để không worker nào phải chờ đăng nhập."""
+        await self._auth_handler.get_auth_headers()
+
+    def graphql_stats(self, reset: bool = False) -> dict:
+        stats = self._client.stats()
+        if self._price_update_batcher:
+            stats["price_updates"] = self._price_update_batcher.stats()
+        if reset:
+            self._client.reset_stats()
+            if self._price_update_batcher:
+                self._price_update_batcher.reset_stats()
+        return stats
+
     async def __aenter__(self):
         return self
 
@@ -45,23 +73,54 @@ class EnebaClient:
             "first": 1
         }
 
-        response_json = await self._client.execute(
+        return await self._client.execute(
+            query=S_PRODUCTS_BY_SLUGS_QUERY,
+            variables=variables,
+            response_model=SProductsGraphQLResponse,
+            batch=False
+        )
+
+    async def get_products_by_slugs(self, slugs: List[str], first: Optional[int] = None) -> SProductsGraphQLResponse:
+        """Resolve nhiều slug trong một request S_products (tối đa `first` sản phẩm, mặc định len(slugs))."""
+        variables = {
+            "slugs": slugs,
+            "sort": "CREATED_AT_DESC",
+            "first": first or len(slugs)
+        }
+
+        return await self._client.execute(
             query=S_PRODUCTS_BY_SLUGS_QUERY,
-            variables=variables
+            variables=variables,
+            response_model=SProductsGraphQLResponse,
+            batch=False
         )
 
-        return SProductsGraphQLResponse.model_validate(response_json)
+    @staticmethod
+    def _competition_request(variables: dict, after: Optional[str] = None, paged: bool = True) -> tuple[str, dict]:
+        """Query S_competition: chỉ lấy COMPETITION_PAGE_SIZE người bán mỗi sản phẩm nếu > 0 và paged."""
+        if not paged or settings.COMPETITION_PAGE_SIZE <= 0:
+            return S_COMPETITION_QUERY, variables
+        return S_COMPETITION_PAGE_QUERY, {**variables, "first": settings.COMPETITION_PAGE_SIZE, "after": after}
 
     # Thêm async/await
-    async def get_competition_by_product_id(self, product_id: UUID) -> SCompetitionGraphQLResponse:
+    async def get_competition_by_product_id(self, product_id: UUID, after: Optional[str] = None,
+                                            paged: bool = True) -> SCompetitionGraphQLResponse:
         product_id_str = str(product_id)
 
-        variables = {
-            "productIds": product_id_str,
-        }
+        query, variables = self._competition_request({"productIds": product_id_str}, after=after, paged=paged)
+
+        return await self._client.execute(query=query, variables=variables,
+                                          response_model=SCompetitionGraphQLResponse, batch=False)
+
+    async def get_competition_by_product_ids(self, product_ids: List[UUID],
+                                             paged: bool = True) -> SCompetitionGraphQLResponse:
+        """Lấy competition của nhiều sản phẩm trong một request (S_competition nhận list productIds)."""
+        query, variables = self._competition_request({
+            "productIds": [str(product_id) for product_id in product_ids],
+        }, paged=paged)
 
-        response_json = await self._client.execute(query=S_COMPETITION_QUERY, variables=variables)
-        return SCompetitionGraphQLResponse.model_validate(response_json)
+        return await self._client.execute(query=query, variables=variables,
+                                          response_model=SCompetitionGraphQLResponse, batch=False)
 
     # Thêm async/await
     async def calculate_price(
@@ -77,13 +136,12 @@ class EnebaClient:
             "input": input_data.model_dump(by_alias=True)
         }
 
-        response_json = await self._client.execute(
+        return await self._client.execute(
             query=S_CALCULATE_PRICE_QUERY,
-            variables=variables
+            variables=variables,
+            response_model=SCalculatePriceGraphQLResponse
         )
 
-        return SCalculatePriceGraphQLResponse.model_validate(response_json)
-
     async def update_auction(
             self,
             auction_id: str,
@@ -97,11 +155,16 @@ class EnebaClient:
             "input": input_data.model_dump(by_alias=True)
         }
         logging.info(f"Price send to site:{price_input.amount}")
-        response_json = await self._client.execute(
-            query=S_UPDATE_AUCTION_MUTATION,
-            variables=variables
-        )
-
+        if not self._price_update_batcher:
+            return await self._client.execute(
+                query=S_UPDATE_AUCTION_MUTATION,
+                variables=variables,
+                response_model=SUpdateAuctionGraphQLResponse
+            )
+
+        response_json = await self._price_update_batcher.submit(variables)
+        if response_json.get("errors"):
+            raise GraphQLError(response_json["errors"])
         return SUpdateAuctionGraphQLResponse.model_validate(response_json)
 
     async def get_stock_info(self, stock_id: UUID) -> SStockGraphQLResponse:
@@ -111,9 +174,8 @@ class EnebaClient:
             "stockId": str(stock_id)
         }
 
-        response_json = await self._client.execute(
+        return await self._client.execute(
             query=S_STOCK_QUERY,
-            variables=variables
+            variables=variables,
+            response_model=SStockGraphQLResponse
         )
-
-        return SStockGraphQLResponse.model_validate(response_json)
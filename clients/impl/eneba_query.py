@@ -35,6 +35,33 @@ S_COMPETITION_QUERY = """
         }
     """
 
+# Như S_COMPETITION_QUERY nhưng chỉ lấy `first` người bán mỗi sản phẩm (sau cursor `after`)
+S_COMPETITION_PAGE_QUERY = """
+        query S_competition($productIds: [S_Uuid!]!, $first: Int, $after: String) {
+            S_competition(productIds: $productIds) {
+                productId
+                competition(first: $first, after: $after) {
+                    totalCount
+                    pageInfo {
+                        hasNextPage
+                        endCursor
+                    }
+                    edges {
+                        node {
+                            isInStock
+                            merchantName
+                            belongsToYou
+                            price(currency: eur) {
+                                amount
+                                currency
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    """
+
 S_CALCULATE_PRICE_QUERY = """
     query S_calculatePrice($input: S_API_CalculatePriceInput!) {
         S_calculatePrice(input: $input) {
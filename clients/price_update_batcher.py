@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from clients.base_graphql_client import _has_rate_limit_error
+from clients.exceptions import GraphQLError
+
+# (document, danh sách biến) -> response riêng (data + errors) cho từng operation
+BatchExecutor = Callable[[str, List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+
+
+class PriceUpdateBatcher:
+    """
+    Gom các lần cập nhật giá (S_updateAuction) trong `max_wait` giây (tối đa `max_size` offer)
+    thành một request gồm nhiều mutation alias; mỗi caller nhận về response của riêng offer mình.
+    Alias bị lỗi (kể cả rate limit) được gửi lại riêng, tối đa `max_retries` lần;
+    các alias đã thành công không bao giờ bị gửi lại.
+    """
+
+    def __init__(self, mutation: str, execute_batch: BatchExecutor, max_size: int, max_wait: float,
+                 max_retries: int = 2):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._mutation = mutation
+        self._execute_batch = execute_batch
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.requests = 0
+        self.updates = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def submit(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Trả về response của một mutation (data + errors) như khi gửi riêng."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((variables, future))
+
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.updates += len(batch)
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            self.requests += 1
+            try:
+                results = await self._execute_batch(self._mutation, [variables for variables, _ in pending])
+            except GraphQLError as e:
+                # Cả request bị từ chối vì rate limit: chưa alias nào được thực hiện, gửi lại cả lô
+                if _has_rate_limit_error(e.errors) and attempt < self.max_retries:
+                    self.retried += len(pending)
+                    continue
+                self._fail(pending, e)
+                return
+            except Exception as e:
+                # Lỗi mạng: không biết mutation đã được áp dụng hay chưa nên không gửi lại
+                self._fail(pending, e)
+                return
+
+            failed = []
+            for (variables, future), result in zip(pending, results):
+                if result.get("errors"):
+                    failed.append((variables, future, result))
+                elif not future.done():
+                    future.set_result(result)
+
+            if not failed:
+                return
+            if attempt < self.max_retries:
+                self.retried += len(failed)
+                self.logger.warning(f"{len(failed)}/{len(pending)} price updates failed, retrying only those.")
+                pending = [(variables, future) for variables, future, _ in failed]
+                continue
+            for _, future, result in failed:
+                self._fail([(None, future)], GraphQLError(result["errors"]))
+            return
+
+    def _fail(self, pending: List[Tuple[Any, asyncio.Future]], error: Exception):
+        for _, future in pending:
+            if not future.done():
+                self.failed += 1
+                future.set_exception(error)
+
+    def stats(self) -> Dict[str, int]:
+        return {"updates": self.updates, "requests": self.requests, "retried": self.retried, "failed": self.failed}
+
+    def reset_stats(self):
+        self.requests = 0
+        self.updates = 0
+        self.retried = 0
+        self.failed = 0
@@ -0,0 +1,101 @@
+# clients/rate_limiter.py
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from utils.config import settings
+from utils.rate_limit import TokenBucket
+
+
+class AdaptiveRateLimiter:
+    """
+    Giới hạn tốc độ dùng chung cho mọi request GraphQL ra Eneba (AIMD).
+    - `initial_rate` <= 0: không giới hạn cho tới lần "Too Many Requests" đầu tiên
+      (tính như đang ở `max_rate`), sau đó mới áp dụng AIMD.
+    - Mỗi request lấy một token; tốc độ nạp token là tốc độ cho phép hiện tại.
+    - Mỗi request thành công tăng tốc độ thêm `increase` request/phút (tối đa `max_rate`).
+    - Khi gặp "Too Many Requests": tạm dừng TẤT CẢ request trong Retry-After giây,
+      tốc độ nhân với `decrease_factor` (tối thiểu `min_rate`), rồi tăng dần trở lại.
+    """
+
+    def __init__(self, initial_rate: float, min_rate: float, max_rate: float,
+                 increase: float, decrease_factor: float, burst: float):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.throttled = initial_rate > 0
+        self.rate = min(max(initial_rate, min_rate), max_rate) if self.throttled else max_rate
+        self._bucket = TokenBucket(self.rate, burst)
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "AdaptiveRateLimiter":
+        return cls(
+            initial_rate=settings.ENEBA_RATE_INITIAL_PER_MINUTE,
+            min_rate=settings.ENEBA_RATE_MIN_PER_MINUTE,
+            max_rate=settings.ENEBA_RATE_MAX_PER_MINUTE,
+            increase=settings.ENEBA_RATE_INCREASE_PER_MINUTE,
+            decrease_factor=settings.ENEBA_RATE_DECREASE_FACTOR,
+            burst=settings.ENEBA_RATE_BURST,
+        )
+
+    async def acquire(self):
+        # Lock giữ thứ tự FIFO: caller đang chờ token chặn các caller đến sau
+        async with self._lock:
+            started = time.monotonic()
+            while True:
+                if not self.throttled:
+                    # Chưa từng bị 429: chỉ tôn trọng thời gian tạm dừng (nếu có)
+                    wait = self._paused_until - time.monotonic()
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+                wait = max(self._paused_until - time.monotonic(), self._bucket.time_until_available())
+                if wait <= 0 and self._bucket.try_consume():
+                    break
+                await asyncio.sleep(max(wait, 0.001))
+            self.waited += time.monotonic() - started
+            self.requests += 1
+
+    def on_success(self):
+        if self.throttled and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self._bucket.set_rate(self.rate)
+
+    def on_rate_limited(self, retry_after: float):
+        self.rate_limited += 1
+        now = time.monotonic()
+        already_paused = now < self._paused_until
+        self._paused_until = max(self._paused_until, now + retry_after)
+        if already_paused:
+            # Các request đã gửi trước lúc tạm dừng cũng có thể bị 429: chỉ kéo dài thời gian dừng
+            return
+        self.throttled = True
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._bucket.set_rate(self.rate)
+        self._bucket.drain()
+        self.logger.warning(
+            f"Eneba rate limit hit. Pausing all requests for {retry_after:.0f}s, "
+            f"rate lowered to {self.rate:.0f} req/min.")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "rate_per_minute": round(self.rate, 1) if self.throttled else None,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "waited_seconds": round(self.waited, 1),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+    def reset_stats(self):
+        self.requests = 0
+        self.rate_limited = 0
+        self.waited = 0.0
@@ -0,0 +1,149 @@
+# clients/sheets_account_pool.py
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from clients.exceptions import SheetsRateLimitError
+from utils.config import settings
+from utils.rate_limit import TokenBucket
+
+# Thời gian tạm ngưng một account khi bị 429 mà không có Retry-After
+_DEFAULT_COOLDOWN = 60.0
+
+
+class _Account:
+    """Một service account: client riêng + quota read/write riêng."""
+
+    def __init__(self, index: int, client):
+        self.index = index
+        self.client = client
+        self.read_bucket = TokenBucket(settings.SHEETS_READS_PER_MINUTE, settings.SHEETS_BUCKET_BURST)
+        self.write_bucket = TokenBucket(settings.SHEETS_WRITES_PER_MINUTE, settings.SHEETS_BUCKET_BURST)
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+    def bucket(self, write: bool) -> TokenBucket:
+        return self.write_bucket if write else self.read_bucket
+
+
+class SheetsAccountPool:
+    """
+    Gom nhiều service account (mỗi account một client đã xác thực) sau cùng interface client.
+    - Mỗi request được gửi qua account còn nhiều quota nhất (read/write tính riêng theo từng account).
+    - Account bị 429 được tạm ngưng (Retry-After hoặc 60s) và request chuyển sang account khác.
+    - Chỉ khi mọi account đều bị giới hạn thì SheetsRateLimitError mới được ném ra cho scheduler.
+
+    Lưu ý: spreadsheet phải được chia sẻ cho tất cả các service account trong pool.
+    """
+
+    def __init__(self, clients: List[Any]):
+        if not clients:
+            raise ValueError("SheetsAccountPool needs at least one client.")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._accounts = [_Account(i, client) for i, client in enumerate(clients)]
+        # Chỉ hỗ trợ export CSV khi mọi client đều hỗ trợ (SheetService kiểm tra bằng hasattr)
+        if all(hasattr(client, 'stream_csv_rows') for client in clients):
+            self.stream_csv_rows = self._stream_csv_rows
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def _candidates(self, write: bool) -> List[_Account]:
+        """Các account chưa bị tạm ngưng, account còn nhiều token nhất đứng trước."""
+        now = time.monotonic()
+        available = [a for a in self._accounts if a.cooldown_until <= now]
+        return sorted(available, key=lambda a: (-a.bucket(write).level, a.requests))
+
+    def _throttle(self, account: _Account, error: SheetsRateLimitError):
+        cooldown = error.retry_after or _DEFAULT_COOLDOWN
+        account.cooldown_until = time.monotonic() + cooldown
+        account.read_bucket.drain()
+        account.write_bucket.drain()
+        account.throttled += 1
+        self.logger.warning(
+            f"Service account #{account.index} hit the Sheets quota, cooling down for {cooldown:.0f}s.")
+
+    def _rate_limited(self, last_error: Optional[SheetsRateLimitError]) -> SheetsRateLimitError:
+        now = time.monotonic()
+        retry_after = min(a.cooldown_until for a in self._accounts) - now
+        message = str(last_error) if last_error else "All service accounts are cooling down."
+        return SheetsRateLimitError(message, retry_after=max(1, int(retry_after + 0.999)))
+
+    async def _call(self, method: str, write: bool, *args, **kwargs) -> Any:
+        last_error: Optional[SheetsRateLimitError] = None
+        for account in self._candidates(write):
+            account.bucket(write).try_consume()
+            account.requests += 1
+            try:
+                return await getattr(account.client, method)(*args, **kwargs)
+            except SheetsRateLimitError as e:
+                self._throttle(account, e)
+                last_error = e
+        raise self._rate_limited(last_error)
+
+    async def get_data(self, *args, **kwargs):
+        return await self._call('get_data', False, *args, **kwargs)
+
+    async def batch_get_data(self, *args, **kwargs):
+        return await self._call('batch_get_data', False, *args, **kwargs)
+
+    async def batch_get_values(self, *args, **kwargs):
+        return await self._call('batch_get_values', False, *args, **kwargs)
+
+    async def get_spreadsheet_version(self, *args, **kwargs):
+        """Drive API có quota riêng: không tính vào bucket đọc Sheets, 429 của Drive không tạm ngưng account."""
+        last_error: Optional[SheetsRateLimitError] = None
+        for account in self._candidates(False):
+            try:
+                return await account.client.get_spreadsheet_version(*args, **kwargs)
+            except SheetsRateLimitError as e:
+                last_error = e
+        raise last_error or self._rate_limited(None)
+
+    async def batch_update(self, *args, **kwargs):
+        return await self._call('batch_update', True, *args, **kwargs)
+
+    async def update_data(self, *args, **kwargs):
+        return await self._call('update_data', True, *args, **kwargs)
+
+    async def clear_sheet(self, *args, **kwargs):
+        return await self._call('clear_sheet', True, *args, **kwargs)
+
+    async def _stream_csv_rows(self, *args, **kwargs) -> AsyncIterator[List[str]]:
+        """Chỉ chuyển account khi bị 429 trước khi nhận được hàng đầu tiên."""
+        last_error: Optional[SheetsRateLimitError] = None
+        for account in self._candidates(False):
+            account.read_bucket.try_consume()
+            account.requests += 1
+            started = False
+            try:
+                async for row in account.client.stream_csv_rows(*args, **kwargs):
+                    started = True
+                    yield row
+                return
+            except SheetsRateLimitError as e:
+                if started:
+                    raise
+                self._throttle(account, e)
+                last_error = e
+        raise self._rate_limited(last_error)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Trạng thái từng account, dùng để theo dõi."""
+        now = time.monotonic()
+        return [
+            {
+                "account": a.index,
+                "requests": a.requests,
+                "throttled": a.throttled,
+                "read_tokens": round(a.read_bucket.level, 2),
+                "write_tokens": round(a.write_bucket.level, 2),
+                "cooldown_for": round(max(0.0, a.cooldown_until - now), 1),
+            }
+            for a in self._accounts
+        ]
+
+    async def close(self):
+        for account in self._accounts:
+            await account.client.close()
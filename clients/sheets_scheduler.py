@@ -0,0 +1,138 @@
+# clients/sheets_scheduler.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from clients.exceptions import SheetsRateLimitError
+from utils.config import settings
+from utils.rate_limit import TokenBucket
+
+READ = "read"
+WRITE = "write"
+
+# Số nhỏ hơn = ưu tiên cao hơn
+PRIORITY_HEADER = 0
+PRIORITY_HYDRATION = 1
+PRIORITY_LOG_WRITE = 2
+
+
+class _Lane:
+    """Một hàng đợi có ưu tiên, giới hạn bởi một token bucket (read hoặc write)."""
+
+    def __init__(self, name: str, rate_per_minute: float, burst: float):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.paused_until = 0.0
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+
+class SheetsRequestScheduler:
+    """
+    Điều phối request Google Sheets theo quota mỗi phút.
+    - Read và write dùng hai token bucket riêng (SHEETS_READS_PER_MINUTE / SHEETS_WRITES_PER_MINUTE).
+    - Trong mỗi bucket, request được cấp token theo ưu tiên: header > hydration > ghi log.
+    - Khi gặp 429, cả bucket tạm dừng (theo Retry-After hoặc backoff lũy thừa) rồi request được thử lại.
+    - Khi dùng nhiều service account (SheetsAccountPool), quota được nhân theo số account.
+    """
+
+    def __init__(self, account_count: int = 1):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lanes: Dict[str, _Lane] = {
+            READ: _Lane(READ, settings.SHEETS_READS_PER_MINUTE * account_count,
+                        settings.SHEETS_BUCKET_BURST * account_count),
+            WRITE: _Lane(WRITE, settings.SHEETS_WRITES_PER_MINUTE * account_count,
+                         settings.SHEETS_BUCKET_BURST * account_count),
+        }
+        self._sequence = itertools.count()
+
+    async def run(self, kind: str, priority: int, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        lane = self._lanes[kind]
+        for attempt in range(settings.SHEETS_MAX_RETRIES + 1):
+            await self._acquire(lane, priority)
+            try:
+                return await func(*args)
+            except SheetsRateLimitError as e:
+                if attempt >= settings.SHEETS_MAX_RETRIES:
+                    raise
+                self._pause(lane, attempt, e)
+
+    async def stream(self, kind: str, priority: int, func: Callable[..., AsyncIterator[Any]],
+                     *args) -> AsyncIterator[Any]:
+        """
+        Như run() cho các API trả về stream (export CSV): mỗi lần mở stream tốn một token;
+        chỉ thử lại khi gặp 429 trước khi nhận được phần tử đầu tiên.
+        """
+        lane = self._lanes[kind]
+        for attempt in range(settings.SHEETS_MAX_RETRIES + 1):
+            await self._acquire(lane, priority)
+            started = False
+            try:
+                async for item in func(*args):
+                    started = True
+                    yield item
+                return
+            except SheetsRateLimitError as e:
+                if started or attempt >= settings.SHEETS_MAX_RETRIES:
+                    raise
+                self._pause(lane, attempt, e)
+
+    def _pause(self, lane: _Lane, attempt: int, error: SheetsRateLimitError):
+        delay = error.retry_after if error.retry_after else min(2 ** attempt * 2, 60)
+        lane.paused_until = max(lane.paused_until, time.monotonic() + delay)
+        lane.bucket.drain()
+        self.logger.warning(
+            f"Google Sheets {lane.name} quota exceeded. Pausing {lane.name} requests for {delay:.1f}s "
+            f"(retried {attempt}/{settings.SHEETS_MAX_RETRIES} times so far).")
+
+    async def _acquire(self, lane: _Lane, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.waiters, (priority, next(self._sequence), future))
+        if lane.task is None or lane.task.done():
+            lane.task = asyncio.create_task(self._dispatch(lane))
+        lane.wakeup.set()
+        await future
+
+    async def _dispatch(self, lane: _Lane):
+        while True:
+            if not lane.waiters:
+                lane.wakeup.clear()
+                await lane.wakeup.wait()
+                continue
+
+            pause = lane.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            wait = lane.bucket.time_until_available()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, future = heapq.heappop(lane.waiters)
+            if future.done():  # Caller đã bị hủy
+                continue
+            lane.bucket.try_consume()
+            future.set_result(None)
+
+    def levels(self) -> Dict[str, Dict[str, float]]:
+        """Trạng thái hiện tại của các bucket, dùng để theo dõi."""
+        now = time.monotonic()
+        return {
+            name: {
+                "tokens": round(lane.bucket.level, 2),
+                "waiting": len(lane.waiters),
+                "paused_for": round(max(0.0, lane.paused_until - now), 1),
+            }
+            for name, lane in self._lanes.items()
+        }
+
+    async def close(self):
+        for lane in self._lanes.values():
+            if lane.task:
+                lane.task.cancel()
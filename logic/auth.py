@@ -1,4 +1,7 @@
+import asyncio
+import json
 import logging
+import os
 import time
 from typing import Dict, Optional
 
@@ -9,7 +12,15 @@ from utils.config import settings
 
 
 class EnebaAuthHandler:
-    def __init__(self):
+    """
+    Quản lý access token (async).
+    - Token còn hạn được trả về ngay, không chờ I/O.
+    - Chỉ một lần lấy token chạy tại một thời điểm (lock); các worker khác chờ chung kết quả.
+    - Token được làm mới ở background trước khi hết hạn AUTH_REFRESH_AHEAD_SECONDS giây.
+    - Token được lưu ra AUTH_TOKEN_CACHE_PATH để lần khởi động sau dùng lại nếu còn hạn.
+    """
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.token_url = settings.AUTH_URL
 
@@ -24,41 +35,62 @@ class EnebaAuthHandler:
         self._refresh_token: Optional[str] = None
         self._token_expires_at: float = 0.0
 
-        self._client = httpx.Client()
+        self._owns_client = http_client is None
+        self._client = http_client or httpx.AsyncClient()
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
 
-    def get_auth_headers(self) -> Dict[str, str]:
-        if not self._access_token or time.time() >= self._token_expires_at:
-            self.logger.info("Token is invalid or expired.")
+        self._load_cached_token()
+
+    def _token_is_valid(self) -> bool:
+        return bool(self._access_token) and time.time() < self._token_expires_at
+
+    async def get_auth_headers(self) -> Dict[str, str]:
+        if not self._token_is_valid():
+            await self._acquire_token()
+        elif self._refresh_task is None or self._refresh_task.done():
+            # Token lấy từ cache đĩa: hẹn làm mới background
+            self._schedule_refresh()
+        return {"Authorization": f"Bearer {self._access_token}"}
+
+    async def _acquire_token(self, force: bool = False) -> None:
+        async with self._lock:
+            # Worker khác có thể đã lấy token trong lúc chờ lock
+            if self._token_is_valid() and not force:
+                return
+            self.logger.info("Token is invalid or expired." if not force else "Refreshing token before expiry.")
 
             if self._refresh_token:
                 try:
-                    self._refresh_token_flow()
+                    await self._refresh_token_flow()
                 except ConnectionError:
                     self.logger.warning("Refresh token failed. Falling back to full authentication.")
-                    self._get_new_token_from_credentials()
+                    await self._get_new_token_from_credentials()
             else:
-                self._get_new_token_from_credentials()
+                await self._get_new_token_from_credentials()
 
-        return {"Authorization": f"Bearer {self._access_token}"}
+            self._save_cached_token()
+            self._schedule_refresh()
 
-    def _get_new_token_from_credentials(self) -> None:
+    async def _get_new_token_from_credentials(self) -> None:
         self.logger.info("Requesting new token using credentials...")
-        self._perform_token_request(self._initial_auth_payload)
+        await self._perform_token_request(self._initial_auth_payload)
 
-    def _refresh_token_flow(self) -> None:
+    async def _refresh_token_flow(self) -> None:
         self.logger.info("Requesting new token using refresh token...")
         refresh_payload = {
             "grant_type": "refresh_token",
             "refresh_token": self._refresh_token,
-            "client_id": self.client_id,
+            "client_id": settings.CLIENT_ID,
         }
-        self._perform_token_request(refresh_payload)
+        await self._perform_token_request(refresh_payload)
 
-    def _perform_token_request(self, payload: Dict[str, str]) -> None:
+    async def _perform_token_request(self, payload: Dict[str, str]) -> None:
         try:
             headers = {"Content-Type": "application/x-www-form-urlencoded"}
             headers.update({"X-Proxy-Secret": "embeiuquadi"})
-            response = self._client.post(self.token_url, data=payload, headers=headers)
+            response = await self._client.post(self.token_url, data=payload, headers=headers,
+                                               timeout=settings.http_timeout(settings.AUTH_TIMEOUT))
             response.raise_for_status()
 
             token_data = AccessTokenResponse.model_validate(response.json())
@@ -75,6 +107,75 @@ class EnebaAuthHandler:
         except httpx.HTTPStatusError as e:
             self.logger.error(f"Token request failed: {e.response.status_code} - {e.response.text}")
             raise ConnectionError("Failed to perform token request.") from e
+        except httpx.RequestError as e:
+            self.logger.error(f"Token request failed: {e}")
+            raise ConnectionError("Failed to perform token request.") from e
+
+    def _schedule_refresh(self):
+        if (self._refresh_task and not self._refresh_task.done()
+                and self._refresh_task is not asyncio.current_task()):
+            self._refresh_task.cancel()
+        remaining = self._token_expires_at - time.time()
+        if remaining <= 0:
+            return
+        # Token sống ngắn hơn AUTH_REFRESH_AHEAD_SECONDS: làm mới khi đã dùng được một nửa thời gian
+        delay = max(remaining / 2, remaining - settings.AUTH_REFRESH_AHEAD_SECONDS, 0.0)
+        self._refresh_task = asyncio.create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay: float):
+        await asyncio.sleep(delay)
+        while True:
+            try:
+                await self._acquire_token(force=True)
+                return
+            except Exception as e:
+                if not self._token_is_valid():
+                    # Token đã hết hạn: để request tiếp theo tự lấy lại trên đường chính
+                    self.logger.error(f"Background token refresh failed: {e}")
+                    return
+                self.logger.warning(f"Background token refresh failed, retry in 30s: {e}")
+                await asyncio.sleep(30)
+
+    def _load_cached_token(self):
+        path = settings.AUTH_TOKEN_CACHE_PATH
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get("client_id") != settings.CLIENT_ID:
+                return
+            self._access_token = cached.get("access_token")
+            self._refresh_token = cached.get("refresh_token")
+            self._token_expires_at = float(cached.get("expires_at", 0))
+            if self._token_is_valid():
+                self.logger.info("Reusing cached access token.")
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"Cannot load cached token '{path}': {e}")
+
+    def _save_cached_token(self):
+        path = settings.AUTH_TOKEN_CACHE_PATH
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({
+                    "client_id": settings.CLIENT_ID,
+                    "access_token": self._access_token,
+                    "refresh_token": self._refresh_token,
+                    "expires_at": self._token_expires_at,
+                }, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Cannot save token cache '{path}': {e}")
 
     def close(self):
-        self._client.close()
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+
+    async def aclose(self):
+        self.close()
+        if self._owns_client:
+            await self._client.aclose()
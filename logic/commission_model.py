@@ -0,0 +1,193 @@
+import bisect
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+# (gross cents) -> (net cents, with-commission cents)
+Sample = Tuple[int, int, int]
+# (gross_from, gross_to, net_slope, net_intercept, with_slope, with_intercept, số mẫu)
+Segment = Tuple[int, int, float, float, float, float, int]
+
+
+def _fit_line(points: List[Tuple[int, int]]) -> Tuple[float, float]:
+    """Hồi quy tuyến tính y = a*x + b (bình phương tối thiểu)."""
+    n = len(points)
+    if n == 1:
+        return 0.0, float(points[0][1])
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return 0.0, mean_y
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return slope, mean_y - slope * mean_x
+
+
+def _max_residual(points: List[Tuple[int, int]], slope: float, intercept: float) -> float:
+    return max(abs(round(slope * x + intercept) - y) for x, y in points)
+
+
+def _fit_segments(samples: List[Sample], tolerance: int) -> List[Segment]:
+    """
+    Chia các mẫu (đã sắp theo giá gross) thành các đoạn tuyến tính: phí % + phí cố định,
+    mỗi bậc (tier) có thể có % và phí khác nhau. Một đoạn được nối dài khi mọi mẫu trong đoạn
+    vẫn khớp đường thẳng với sai số <= tolerance cent.
+    """
+    segments: List[Segment] = []
+    start = 0
+    while start < len(samples):
+        end = start + 1
+        fit = None
+        while end <= len(samples):
+            window = samples[start:end]
+            net_line = _fit_line([(g, n) for g, n, _ in window])
+            with_line = _fit_line([(g, w) for g, _, w in window])
+            if (_max_residual([(g, n) for g, n, _ in window], *net_line) > tolerance
+                    or _max_residual([(g, w) for g, _, w in window], *with_line) > tolerance):
+                break
+            fit = (window[0][0], window[-1][0], *net_line, *with_line, len(window))
+            end += 1
+        segments.append(fit)
+        start += fit[6]
+    return segments
+
+
+class CommissionModel:
+    """
+    Mô hình commission học từ các kết quả S_calculatePrice (theo từng sản phẩm).
+
+    - record(): lưu mẫu (gross, net, with-commission) trả về từ API.
+    - predict(): trả lời cục bộ khi giá gross nằm trong một đoạn đã khớp đủ mẫu và giữa hai mẫu
+      đủ gần nhau (chỉ nội suy, không đoán qua các mốc bậc chưa biết); ngược lại trả về None để gọi API.
+    - Cứ sau `revalidate_every` lần trả lời cục bộ của một sản phẩm, predict() trả về None một lần
+      để kiểm tra lại bằng API; nếu lệch quá tolerance thì mẫu mới làm đoạn bị tách khi fit lại.
+
+    Eneba không trả về category của sản phẩm nên mô hình chỉ được học theo từng sản phẩm.
+    """
+
+    def __init__(self, min_samples: int = 4, tolerance_cents: int = 1, revalidate_every: int = 50,
+                 max_gap_ratio: float = 0.1, max_samples: int = 64, path: Optional[str] = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.min_samples = min_samples
+        self.tolerance_cents = tolerance_cents
+        self.revalidate_every = revalidate_every
+        self.max_gap_ratio = max_gap_ratio
+        self.max_samples = max_samples
+        self.path = path
+
+        self._samples: Dict[str, Dict[int, Tuple[int, int]]] = {}
+        self._segments: Dict[str, List[Segment]] = {}
+        self._sorted_grosses: Dict[str, List[int]] = {}
+        self._answers_since_check: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.mismatches = 0
+        self.load()
+
+    def _segments_for(self, product_id: str) -> List[Segment]:
+        segments = self._segments.get(product_id)
+        if segments is None:
+            samples = sorted((g, n, w) for g, (n, w) in self._samples.get(product_id, {}).items())
+            segments = _fit_segments(samples, self.tolerance_cents) if samples else []
+            self._segments[product_id] = segments
+        return segments
+
+    def _has_close_neighbours(self, product_id: str, gross: int) -> bool:
+        """Giá cần đoán phải nằm giữa hai mẫu đủ gần nhau, để không đoán qua một mốc bậc chưa thấy."""
+        grosses = self._sorted_grosses.get(product_id)
+        if grosses is None:
+            grosses = self._sorted_grosses[product_id] = sorted(self._samples.get(product_id, {}))
+        index = bisect.bisect_left(grosses, gross)
+        if index < len(grosses) and grosses[index] == gross:
+            return True
+        if index == 0 or index == len(grosses):
+            return False
+        return grosses[index] - grosses[index - 1] <= self.max_gap_ratio * gross
+
+    def _evaluate(self, product_id: str, gross: int) -> Optional[Tuple[int, int]]:
+        for gross_from, gross_to, net_a, net_b, with_a, with_b, count in self._segments_for(product_id):
+            if count >= self.min_samples and gross_from <= gross <= gross_to:
+                if not self._has_close_neighbours(product_id, gross):
+                    return None
+                return round(net_a * gross + net_b), round(with_a * gross + with_b)
+        return None
+
+    def predict(self, product_id: str, gross: int) -> Optional[Tuple[int, int]]:
+        """
+        Returns:
+            (net cents, with-commission cents) nếu đủ tin cậy, None nếu cần hỏi API.
+        """
+        product_id = str(product_id)
+        prediction = self._evaluate(product_id, gross)
+        if prediction is None:
+            self.misses += 1
+            return None
+
+        answered = self._answers_since_check.get(product_id, 0)
+        if self.revalidate_every and answered >= self.revalidate_every:
+            # Đến lượt kiểm tra lại: để caller gọi API rồi record() sẽ so sánh
+            self._answers_since_check[product_id] = 0
+            self.misses += 1
+            return None
+
+        self._answers_since_check[product_id] = answered + 1
+        self.hits += 1
+        return prediction
+
+    def record(self, product_id: str, gross: int, net: int, with_commission: int):
+        product_id = str(product_id)
+        prediction = self._evaluate(product_id, gross)
+        if prediction is not None and (abs(prediction[0] - net) > self.tolerance_cents
+                                       or abs(prediction[1] - with_commission) > self.tolerance_cents):
+            # Đoán sai: mẫu mới sẽ tách đoạn khi fit lại; các lần trả lời cục bộ được kiểm tra lại ngay
+            self.mismatches += 1
+            self.logger.warning(
+                f"Commission model mismatch for {product_id} at {gross}: predicted {prediction}, "
+                f"API returned {(net, with_commission)}. Refitting.")
+            self._answers_since_check[product_id] = self.revalidate_every
+
+        samples = self._samples.setdefault(product_id, {})
+        samples.pop(gross, None)
+        samples[gross] = (net, with_commission)
+        while len(samples) > self.max_samples:
+            samples.pop(next(iter(samples)))
+        self._segments.pop(product_id, None)
+        self._sorted_grosses.pop(product_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "products": len(self._samples),
+            "hits": self.hits,
+            "misses": self.misses,
+            "mismatches": self.mismatches,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self._samples = {
+                product_id: {int(g): (int(n), int(w)) for g, n, w in samples}
+                for product_id, samples in raw.items()
+            }
+            self.logger.info(f"Loaded commission samples for {len(self._samples)} products from '{self.path}'.")
+        except (OSError, ValueError, TypeError) as e:
+            self.logger.warning(f"Cannot load commission model '{self.path}', starting empty: {e}")
+            self._samples = {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    product_id: [[g, n, w] for g, (n, w) in samples.items()]
+                    for product_id, samples in self._samples.items()
+                }, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Cannot save commission model '{self.path}': {e}")
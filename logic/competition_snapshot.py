@@ -0,0 +1,131 @@
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from uuid import UUID
+
+from models.eneba_models import CompetitionData, CompetitionEdge, CompetitionNode, Price
+
+# Tên merchant được intern thành số nguyên dùng chung cho mọi snapshot
+_MERCHANT_IDS: Dict[str, int] = {}
+_MERCHANT_NAMES: List[str] = []
+
+
+def intern_merchant(name: str) -> int:
+    merchant_id = _MERCHANT_IDS.get(name)
+    if merchant_id is None:
+        merchant_id = _MERCHANT_IDS[name] = len(_MERCHANT_NAMES)
+        _MERCHANT_NAMES.append(name)
+    return merchant_id
+
+
+def merchant_ids(names: Iterable[str]) -> Set[int]:
+    """Id của các merchant đã từng gặp (merchant chưa gặp thì không thể có trong snapshot)."""
+    return {_MERCHANT_IDS[name] for name in names if name in _MERCHANT_IDS}
+
+
+class CompetitionSnapshot:
+    """
+    Danh sách người bán của một sản phẩm dạng struct-of-arrays:
+    merchant id (đã intern), giá gross theo cent, cờ còn hàng / của mình.
+    Thứ tự giữ nguyên như API trả về; chỉ dựng CompetitionEdge cho vài người bán cần ghi log.
+    Khi competition được phân trang, `next_cursor` là cursor của trang kế tiếp (None nếu đã hết).
+    """
+    __slots__ = ("merchants", "prices", "in_stock", "belongs_to_you", "currency", "product_id", "next_cursor")
+
+    def __init__(self, merchants: array, prices: array, in_stock: bytes, belongs_to_you: bytes,
+                 currency: str = "EUR", product_id: Optional[UUID] = None, next_cursor: Optional[str] = None):
+        self.merchants = merchants
+        self.prices = prices
+        self.in_stock = in_stock
+        self.belongs_to_you = belongs_to_you
+        self.currency = currency
+        self.product_id = product_id
+        self.next_cursor = next_cursor
+
+    @classmethod
+    def from_edges(cls, edges: Sequence[CompetitionEdge], product_id: Optional[UUID] = None,
+                   next_cursor: Optional[str] = None) -> "CompetitionSnapshot":
+        """Dựng từ edges của S_competition (giá theo cent)."""
+        nodes = [edge.node for edge in edges]
+        return cls(
+            merchants=array('l', [intern_merchant(node.merchant_name) for node in nodes]),
+            prices=array('q', [int(round(node.price.amount)) for node in nodes]),
+            in_stock=bytes(node.is_in_stock for node in nodes),
+            belongs_to_you=bytes(node.belongs_to_you for node in nodes),
+            currency=nodes[0].price.currency if nodes else "EUR",
+            product_id=product_id,
+            next_cursor=next_cursor,
+        )
+
+    @classmethod
+    def from_competition(cls, product_id: UUID, competition: CompetitionData) -> "CompetitionSnapshot":
+        return cls.from_edges(competition.edges, product_id=product_id, next_cursor=competition.next_cursor)
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def take(self, indexes: Sequence[int]) -> "CompetitionSnapshot":
+        return CompetitionSnapshot(
+            merchants=array('l', [self.merchants[i] for i in indexes]),
+            prices=array('q', [self.prices[i] for i in indexes]),
+            in_stock=bytes(self.in_stock[i] for i in indexes),
+            belongs_to_you=bytes(self.belongs_to_you[i] for i in indexes),
+            currency=self.currency,
+            product_id=self.product_id,
+            next_cursor=self.next_cursor,
+        )
+
+    def extend(self, page: "CompetitionSnapshot") -> "CompetitionSnapshot":
+        """Nối trang kế tiếp vào sau; cursor lấy theo trang mới."""
+        return CompetitionSnapshot(
+            merchants=self.merchants + page.merchants,
+            prices=self.prices + page.prices,
+            in_stock=self.in_stock + page.in_stock,
+            belongs_to_you=self.belongs_to_you + page.belongs_to_you,
+            currency=self.currency if len(self) else page.currency,
+            product_id=self.product_id,
+            next_cursor=page.next_cursor,
+        )
+
+    def available(self) -> "CompetitionSnapshot":
+        """Chỉ giữ người bán còn hàng và có giá > 0."""
+        return self.take([i for i, (stock, price) in enumerate(zip(self.in_stock, self.prices))
+                          if stock and price > 0])
+
+    def is_price_sorted(self) -> bool:
+        """Giá của các người bán còn hàng không giảm theo thứ tự API trả về (điều kiện để phân trang)."""
+        prices = [price for price, stock in zip(self.prices, self.in_stock) if stock and price > 0]
+        return all(a <= b for a, b in zip(prices, prices[1:]))
+
+    def merchant_name(self, index: int) -> str:
+        return _MERCHANT_NAMES[self.merchants[index]]
+
+    def amount(self, index: int) -> float:
+        """Giá gross theo đơn vị tiền (như `price.amount / 100` trước đây)."""
+        return self.prices[index] / 100
+
+    def filter_indexes(
+            self,
+            amounts: Sequence[float],
+            blacklist: Set[int],
+            min_price: Optional[float],
+            max_price: Optional[float]
+    ) -> List[int]:
+        """Chỉ số các người bán không bị blacklist, giá > 0 và trong khoảng [min_price, max_price]."""
+        low = float('-inf') if min_price is None else min_price
+        high = float('inf') if max_price is None else max_price
+        return [i for i, (merchant, amount) in enumerate(zip(self.merchants, amounts))
+                if merchant not in blacklist and amount > 0 and low <= amount <= high]
+
+    @staticmethod
+    def cheapest(indexes: Sequence[int], amounts: Sequence[float], k: int) -> List[int]:
+        """k người bán rẻ nhất (ổn định: cùng giá thì giữ thứ tự API) mà không cần sort cả danh sách."""
+        return heapq.nsmallest(k, indexes, key=amounts.__getitem__)
+
+    def to_edge(self, index: int, amount: Optional[float] = None) -> CompetitionEdge:
+        return CompetitionEdge(node=CompetitionNode(
+            isInStock=bool(self.in_stock[index]),
+            merchantName=self.merchant_name(index),
+            belongsToYou=bool(self.belongs_to_you[index]),
+            price=Price(amount=self.amount(index) if amount is None else amount, currency=self.currency),
+        ))
@@ -1,7 +1,8 @@
 import logging
 import random
 from datetime import datetime
-from typing import List
+from functools import partial
+from typing import List, Callable
 
 from models.eneba_models import CompetitionEdge
 from models.logic_models import PayloadResult, CompareTarget, AnalysisResult
@@ -96,11 +97,16 @@ class Processor:
     async def process_single_payload(self, payload: Payload) -> PayloadResult:
         if not self._validate_payload(payload):
             return PayloadResult(payload=payload, log_message="Payload validation failed.")
+        if payload.hydration_failed:
+            # Không định giá khi thiếu min/max/blacklist: giá sẽ không bị chặn trong khoảng min/max
+            logging.warning(f"Cannot read referenced min/max/blacklist cells for row {payload.row_index}.")
+            return PayloadResult(status=0, payload=payload,
+                                 log_message="Cannot read min/max/blacklist cells (check sheet/cell references).")
         try:
             if not payload.is_compare_enabled:
                 logging.info(f"Skipping comparison for product: {payload.product_name}")
                 final_price = round_up_to_n_decimals(payload.fetched_min_price, payload.price_rounding)
-                log_str = get_log_string(
+                log = deferred_log(
                     mode="not_compare",
                     payload=payload,
                     final_price=final_price
@@ -109,11 +115,10 @@ class Processor:
                 return PayloadResult(
                     status=1,
                     payload=payload,
-                    final_price=CompareTarget(name="No Comparison", price=final_price),
-                    log_message=log_str
-                )
+                    final_price=CompareTarget(name="No Comparison", price=final_price)
+                ).with_log_renderer(*log)
 
-            payload.product_compare = payload.product_compare.replace("https://", "").split("/")[1]
+            payload.product_compare = self.eneba_service.get_slug_from_url(payload.product_compare)
 
             # Thêm `await`
             product_competition = await self.eneba_service.get_competition_by_slug(payload.product_compare)
@@ -131,11 +136,8 @@ class Processor:
 
             # Thêm `await`
             analysis_result = await self.eneba_service.analyze_competition(payload, product_competition)
-            if not analysis_result.top_sellers_for_log:
-                product_competition = await self.eneba_service.enrich_products_with_commission(payload,
-                                                                                               product_competition)
-            else:
-                product_competition = analysis_result.top_sellers_for_log
+            # Chỉ vài người bán đầu (đã tính commission) được dựng thành edge để ghi log
+            product_competition = analysis_result.top_sellers_for_log
             payload.target_price = analysis_result.competitive_price
 
             # Hàm này là sync (logic), không cần await
@@ -144,7 +146,7 @@ class Processor:
             if payload.get_min_price_value() is not None and edited_price < payload.get_min_price_value():
                 logging.info(
                     f"Final price ({edited_price:.3f}) is below min_price ({payload.get_min_price_value():.3f}), not updating.")
-                log_str = get_log_string(
+                log = deferred_log(
                     mode="below_min",
                     payload=payload,
                     final_price=edited_price,
@@ -154,12 +156,11 @@ class Processor:
                 return PayloadResult(
                     status=0,
                     payload=payload,
-                    final_price=None,
-                    log_message=log_str
-                )
+                    final_price=None
+                ).with_log_renderer(*log)
             elif payload.get_min_price_value() is None:
                 logging.info("No min_price set, not updating.")
-                log_str = get_log_string(
+                log = deferred_log(
                     mode="no_min_price",
                     payload=payload,
                     final_price=edited_price,
@@ -169,13 +170,12 @@ class Processor:
                 return PayloadResult(
                     status=0,
                     payload=payload,
-                    final_price=None,
-                    log_message=log_str
-                )
+                    final_price=None
+                ).with_log_renderer(*log)
             elif not payload.is_follow_price and payload.current_price <= payload.target_price and analysis_result.competitor_name != "Not found":
                 if payload.current_price < payload.get_min_price_value():
                     logging.info("Current price is below min_price, updating to min_price.")
-                    log_str = get_log_string(
+                    log = deferred_log(
                         mode="not_follow_but_below_min",
                         payload=payload,
                         final_price=edited_price,
@@ -186,12 +186,11 @@ class Processor:
                         status=1,
                         payload=payload,
                         final_price=CompareTarget(name=analysis_result.competitor_name, price=edited_price),
-                        competition=product_competition,
-                        log_message=log_str
-                    )
+                        competition=product_competition
+                    ).with_log_renderer(*log)
 
                 logging.info("Not follow the price, not updating.")
-                log_str = get_log_string(
+                log = deferred_log(
                     mode="not_follow",
                     payload=payload,
                     final_price=edited_price,
@@ -201,12 +200,11 @@ class Processor:
                 return PayloadResult(
                     status=2,
                     payload=payload,
-                    final_price=None,
-                    log_message=log_str
-                )
+                    final_price=None
+                ).with_log_renderer(*log)
             elif payload.current_price == edited_price:
                 logging.info("Current price is equal to edited price.")
-                log_str = get_log_string(
+                log = deferred_log(
                     mode="equal",
                     payload=payload,
                     final_price=edited_price,
@@ -216,10 +214,9 @@ class Processor:
                 return PayloadResult(
                     status=0,
                     payload=payload,
-                    final_price=None,
-                    log_message=log_str
-                )
-            log_str = get_log_string(
+                    final_price=None
+                ).with_log_renderer(*log)
+            log = deferred_log(
                 mode="compare",
                 payload=payload,
                 final_price=edited_price,
@@ -230,9 +227,8 @@ class Processor:
                 status=1,
                 payload=payload,
                 competition=product_competition,
-                final_price=CompareTarget(name=analysis_result.competitor_name, price=edited_price),
-                log_message=log_str
-            )
+                final_price=CompareTarget(name=analysis_result.competitor_name, price=edited_price)
+            ).with_log_renderer(*log)
         except Exception as e:
             logging.error(f"Error processing payload {payload.product_name}: {e}")
             return PayloadResult(
@@ -253,11 +249,11 @@ class Processor:
             logging.info(
                 f"Successfully processed payload for {payload.product_name}. Final price: {payload_result.final_price.price:.3f}")
             log_data = {
-                'note': payload_result.log_message,
+                'note': payload_result.render_log_message(),
                 'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
         else:
-            logging.error(f"Failed to process payload for {payload.product_name}. Error: {payload_result.log_message}")
+            logging.error(f"Failed to process payload for {payload.product_name}. Error: {payload_result.render_log_message()}")
 
 
 # Hàm này là logic thuần túy, không cần async
@@ -357,3 +353,68 @@ def get_log_string(
         if analysis_result:
             log_parts.append(_analysis_log_string(payload, analysis_result, filtered_products))
     return " ".join(log_parts)
+
+
+# Các mode có in final_price trong log
+_FINAL_PRICE_MODES = {"not_compare", "compare", "below_min", "not_follow_but_below_min"}
+
+
+def _edges_fingerprint(edges: List[CompetitionEdge] | None, limit: int, skip: set | None = None) -> tuple:
+    if not edges:
+        return ()
+    skip = skip or set()
+    return tuple(
+        (s.node.merchant_name, s.node.price.price_no_commission, s.node.price.old_price_with_commission)
+        for s in edges[:limit] if s.node.merchant_name not in skip
+    )
+
+
+def get_log_fingerprint(
+        mode: str,
+        payload: Payload,
+        final_price: float,
+        analysis_result: AnalysisResult = None,
+        filtered_products: List[CompetitionEdge] = None
+) -> tuple:
+    """
+    Những giá trị quyết định nội dung của get_log_string (bỏ qua timestamp).
+    Chỉ gồm các trường mà mode đó thật sự in ra: final_price có độ lệch ngẫu nhiên mỗi vòng,
+    nên các mode không in nó (not_follow, equal, no_min_price) không được đưa nó vào.
+    """
+    fingerprint = (mode,)
+    if mode in _FINAL_PRICE_MODES:
+        # Log in final_price với 3 chữ số thập phân
+        fingerprint += (round(final_price, 3) if final_price is not None else None,)
+    if mode == "below_min":
+        fingerprint += (payload.get_min_price_value(),)
+    if analysis_result is None or mode == "not_compare":
+        return fingerprint
+    return fingerprint + (
+        payload.current_price,
+        payload.fetched_min_price,
+        payload.fetched_max_price,
+        analysis_result.competitor_name,
+        analysis_result.competitive_price,
+        _edges_fingerprint(analysis_result.sellers_below_min, 6, set(payload.fetched_black_list or [])),
+        _edges_fingerprint(filtered_products, 4),
+    )
+
+
+def deferred_log(
+        mode: str,
+        payload: Payload,
+        final_price: float,
+        analysis_result: AnalysisResult = None,
+        filtered_products: List[CompetitionEdge] = None
+) -> tuple[tuple, Callable[[], str]]:
+    """Trả về (fingerprint, renderer) để PayloadResult chỉ dựng log khi note thật sự cần ghi."""
+    fingerprint = get_log_fingerprint(mode, payload, final_price, analysis_result, filtered_products)
+    renderer = partial(
+        get_log_string,
+        mode=mode,
+        payload=payload,
+        final_price=final_price,
+        analysis_result=analysis_result,
+        filtered_products=filtered_products
+    )
+    return fingerprint, renderer
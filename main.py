@@ -1,16 +1,24 @@
 import asyncio
+import importlib.util
 import logging
 from datetime import datetime
+from typing import Optional
 
 import httpx
 
-from clients.google_sheets_client import GoogleSheetsClient
+from clients.async_google_sheets_client import AsyncGoogleSheetsClient
+from clients.fake_google_sheets_client import FakeGoogleSheetsClient
+from clients.google_sheets_client import GoogleSheetsClient, ThreadedGoogleSheetsClient
+from clients.sheets_account_pool import SheetsAccountPool
+from clients.sheets_scheduler import SheetsRequestScheduler
 from clients.impl.eneba_client import EnebaClient
 from logic.processor import Processor  # File processor.py của bạn (đã async)
 from models.sheet_models import Payload  # Cần import Payload
 from services.eneba_service import EnebaService
+from services.sheet_log_writer import SheetLogWriter
 from services.sheet_service import SheetService
 from utils.config import settings
+from utils.http_stats import HttpConnectionStats
 
 
 # Bỏ 'from time import sleep'
@@ -19,10 +27,9 @@ from utils.config import settings
 # --- TÁCH LOGIC RA HÀM RIÊNG ---
 async def process_payload_wrapper(
         payload: Payload,
-        sheet_service: SheetService,
+        log_writer: SheetLogWriter,
         processor: Processor,
-        worker_semaphore: asyncio.Semaphore,  # Đổi tên cho rõ
-        google_sheets_lock: asyncio.Semaphore  # Thêm khóa cho Google Sheets
+        worker_semaphore: asyncio.Semaphore  # Đổi tên cho rõ
 ):
     """
     Hàm này xử lý MỘT payload và giải phóng semaphore khi hoàn thành.
@@ -30,24 +37,24 @@ async def process_payload_wrapper(
     try:
         logging.info(f"Start processing {payload.row_index}...")
 
-        # --- BẢO VỆ GOOGLE SHEETS ---
-        async with google_sheets_lock:
-            logging.debug(f"Row {payload.row_index} acquiring Google Sheets lock to fetch data.")
-            # 1. Lấy dữ liệu (đồng bộ)
-            hydrated_payload = await asyncio.to_thread(
-                sheet_service.fetch_data_for_payload, payload
-            )
-            logging.debug(f"Row {payload.row_index} released Google Sheets lock.")
-        # --- KẾT THÚC BẢO VỆ ---
+        # 1. Dữ liệu min/max/stock/blacklist đã được hydrate cho cả vòng trong run_automation
 
         # 2. Kiểm tra quota (bất đồng bộ - CÓ THỂ CHẠY SONG SONG)
         hydrated_payload, _quota_remain, _quota_count = await processor.eneba_service.check_next_free_in_minutes(
-            hydrated_payload)
+            payload)
 
         # 3. Xử lý logic (bất đồng bộ - CÓ THỂ CHẠY SONG SONG)
         result = await processor.process_single_payload(hydrated_payload)
 
-        log_data = None
+        # Fingerprint + hàm dựng log: chỉ dựng và ghi note khi nội dung thực sự thay đổi
+        note_fingerprint = None
+        build_log_data = None
+
+        def _log_data(note: str) -> dict:
+            return {
+                'note': note,
+                'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
 
         if result.status == 1:
             if _quota_remain is not None and _quota_count > 0:
@@ -59,40 +66,28 @@ async def process_payload_wrapper(
                 logging.info(
                     f"Xử lý thành công hàng {payload.row_index} ({payload.product_name}). "
                     f"Giá mới: {result.final_price.price:.3f}. Còn {_quota_count} lượt.")
-                log_data = {
-                    'note': f"Quote remain: {_quota_count} times\n" + result.log_message,
-                    'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                note_fingerprint = ("updated", _quota_count, result.log_fingerprint or result.log_message)
+                build_log_data = lambda: _log_data(
+                    f"Quote remain: {_quota_count} times\n" + result.render_log_message())
             else:
                 result.log_message = f"Không đủ quota cho hàng {payload.row_index}. Chờ {_quota_remain} phút."
                 logging.warning(result.log_message)
-                log_data = {
-                    'note': f"Quota = 0. Next free in: {_quota_remain}\n{result.log_message}",
-                    'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
+                note_fingerprint = ("no_quota", _quota_remain)
+                build_log_data = lambda: _log_data(
+                    f"Quota = 0. Next free in: {_quota_remain}\n{result.log_message}")
         elif result.status == 2:
             logging.info(f"Giá hiện tại thấp hơn, không cập nhật hàng {payload.row_index}. Còn {_quota_count} lượt.")
-            log_data = {
-                'note': f"Quote remain: {_quota_count} times\n" + result.log_message,
-                'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+            note_fingerprint = ("not_follow", _quota_count, result.log_fingerprint or result.log_message)
+            build_log_data = lambda: _log_data(
+                f"Quote remain: {_quota_count} times\n" + result.render_log_message())
         else:
-            logging.warning(f"Hàng {payload.row_index} không đủ điều kiện xử lý. Log: {result.log_message}")
-            log_data = {
-                'note': result.log_message,
-                'last_update': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+            logging.warning(f"Hàng {payload.row_index} không đủ điều kiện xử lý. Log: {result.render_log_message()}")
+            note_fingerprint = ("skipped", result.log_fingerprint or result.log_message)
+            build_log_data = lambda: _log_data(result.render_log_message())
 
-        if log_data:
-            # --- BẢO VỆ GOOGLE SHEETS ---
-            async with google_sheets_lock:
-                logging.debug(f"Row {payload.row_index} acquiring Google Sheets lock to update log.")
-                # 5. Cập nhật log (đồng bộ)
-                await asyncio.to_thread(
-                    sheet_service.update_log_for_payload, payload, log_data
-                )
-                logging.debug(f"Row {payload.row_index} released Google Sheets lock.")
-            # --- KẾT THÚC BẢO VỆ ---
+        if build_log_data:
+            # 5. Cập nhật log: đưa vào bộ đệm write-behind, không chờ Google Sheets
+            log_writer.enqueue_if_changed(payload, note_fingerprint, build_log_data)
 
         # 6. Nghỉ ngơi (nếu có config)
         if payload.relax and int(payload.relax) > 0:
@@ -105,15 +100,8 @@ async def process_payload_wrapper(
     except Exception as e:
         logging.error(f"Lỗi nghiêm trọng khi xử lý hàng {payload.row_index}: {e}", exc_info=True)
         try:
-            # --- BẢO VỆ GOOGLE SHEETS (kể cả khi log lỗi) ---
-            async with google_sheets_lock:
-                logging.debug(f"Row {payload.row_index} acquiring Google Sheets lock to log error.")
-                # Ghi lại lỗi lên sheet (đồng bộ)
-                await asyncio.to_thread(
-                    sheet_service.update_log_for_payload, payload, {'note': f"Error: {e}"}
-                )
-                logging.debug(f"Row {payload.row_index} released Google Sheets lock.")
-            # --- KẾT THÚC BẢO VỆ ---
+            # Ghi lại lỗi lên sheet (qua bộ đệm write-behind)
+            log_writer.enqueue_if_changed(payload, ("error", str(e)), lambda: {'note': f"Error: {e}"})
         except Exception as log_e:
             logging.error(f"Không thể ghi log lỗi cho hàng {payload.row_index}: {log_e}")
 
@@ -122,85 +110,177 @@ async def process_payload_wrapper(
         worker_semaphore.release()
 
 
+async def process_payload_when_free(
+        payload: Payload,
+        log_writer: SheetLogWriter,
+        processor: Processor,
+        worker_semaphore: asyncio.Semaphore
+):
+    """Chờ có worker trống rồi mới xử lý, để vòng đọc sheet không bị chặn khi đang stream."""
+    await worker_semaphore.acquire()
+    await process_payload_wrapper(payload, log_writer, processor, worker_semaphore)
+
+
 # --- HÀM CHÍNH ĐÃ SỬA ---
 async def run_automation(
         sheet_service: SheetService,
         processor: Processor,
-        google_sheets_lock: asyncio.Semaphore  # Thêm tham số
+        log_writer: SheetLogWriter,
+        http_stats: Optional[HttpConnectionStats] = None
 ):
     CONCURRENT_TASKS = settings.WORKERS
 
     worker_semaphore = asyncio.Semaphore(CONCURRENT_TASKS)  # Đây là semaphore cho worker
     tasks = []
 
+    # Dữ liệu competition chỉ dùng trong một vòng
+    processor.eneba_service.clear_prefetch()
+
     try:
         logging.info("Getting payloads from Google Sheets...")
 
-        # Chỉ có 1 tác vụ đọc sheet, nên không cần khóa ở đây
-        payloads_to_process = await asyncio.to_thread(
-            sheet_service.get_payloads_to_process
-        )
-
-        if not payloads_to_process:
-            logging.info("No payloads to process.")
-            return
-
-        logging.info(
-            f"Found {len(payloads_to_process)} payloads. Start to process (max {CONCURRENT_TASKS} row)...")
+        # Chế độ csv trả về nhiều lô khi đang tải; các chế độ khác trả về một lô cho cả vòng
+        async for payloads_to_process in sheet_service.iter_payload_batches():
+            logging.info(
+                f"Found {len(payloads_to_process)} payloads. Start to process (max {CONCURRENT_TASKS} row)...")
 
-        for payload in payloads_to_process:
-            await worker_semaphore.acquire()
+            # Hydrate min/max/stock/blacklist cho cả lô: mỗi spreadsheet chỉ một lần batchGet
+            await sheet_service.hydrate_payloads(payloads_to_process)
 
-            task = asyncio.create_task(
-                process_payload_wrapper(
-                    payload,
-                    sheet_service,
-                    processor,
-                    worker_semaphore,  # Semaphore cho worker
-                    google_sheets_lock  # Khóa cho Google Sheets
+            # Lấy trước competition cho cả lô bằng S_competition gộp nhiều productIds
+            try:
+                await processor.eneba_service.prefetch_competition(payloads_to_process)
+            except Exception as e:
+                logging.warning(f"Cannot prefetch competition, fall back to per-row requests: {e}")
+
+            for payload in payloads_to_process:
+                task = asyncio.create_task(
+                    process_payload_when_free(
+                        payload,
+                        log_writer,
+                        processor,
+                        worker_semaphore  # Semaphore cho worker
+                    )
                 )
-            )
-            tasks.append(task)
-
-        await asyncio.gather(*tasks)
-        logging.info("Complete row.")
+                tasks.append(task)
 
     except Exception as e:
         logging.critical(f"Error in processing row: {e}", exc_info=True)
+    finally:
+        # Luôn chờ các task đã tạo, kể cả khi đọc sheet/hydrate một lô sau bị lỗi,
+        # để không task nào chạy sang vòng sau và xử lý trùng hàng
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logging.info("Complete row.")
+        # Cuối vòng: ghi nốt các log còn trong bộ đệm
+        await log_writer.flush()
+
+    if not tasks:
+        logging.info("No payloads to process.")
+        return
+
+    try:
+        logging.info(f"Google Sheets quota buckets: {sheet_service.scheduler.levels()}")
+        logging.info(f"Commission price: {processor.eneba_service.commission_cache_stats()}")
+        processor.eneba_service.save_commission_model()
+        # Số liệu theo từng vòng: số request được gộp (single-flight) và gộp alias (batching)
+        logging.info(f"Eneba GraphQL: {processor.eneba_service.graphql_stats(reset=True)}")
+        if isinstance(sheet_service.client, SheetsAccountPool):
+            logging.info(f"Google Sheets service accounts: {sheet_service.client.stats()}")
+        if http_stats:
+            # Số kết nối/TLS handshake mới so với số request: kiểm tra pool có được dùng lại không
+            logging.info(f"HTTP connections: {http_stats.stats()}")
+            http_stats.reset_stats()
+
+    except Exception as e:
+        logging.error(f"Cannot log round statistics: {e}", exc_info=True)
+
+
+def build_sheets_client(shared_http_client: httpx.AsyncClient):
+    """Chọn Google Sheets client theo settings.SHEETS_CLIENT để có thể so sánh A/B."""
+    if settings.SHEETS_CLIENT == "fake":
+        logging.info(f"Using fake Google Sheets client backed by '{settings.FAKE_SHEETS_DIR}'.")
+        return FakeGoogleSheetsClient(data_dir=settings.FAKE_SHEETS_DIR, latency=settings.FAKE_SHEETS_LATENCY,
+                                      quota_error_rate=settings.FAKE_SHEETS_QUOTA_ERROR_RATE)
+
+    key_paths = settings.GOOGLE_KEY_PATHS
+    if settings.SHEETS_CLIENT == "httpx":
+        logging.info(f"Using native async Google Sheets client (httpx), {len(key_paths)} service account(s).")
+        clients = [AsyncGoogleSheetsClient(key_path, http_client=shared_http_client) for key_path in key_paths]
+    else:
+        logging.info(f"Using googleapiclient Google Sheets client (thread), {len(key_paths)} service account(s).")
+        clients = [ThreadedGoogleSheetsClient(GoogleSheetsClient(key_path)) for key_path in key_paths]
+
+    if len(clients) == 1:
+        return clients[0]
+    return SheetsAccountPool(clients)
+
+
+def build_http_client(http_stats: HttpConnectionStats) -> httpx.AsyncClient:
+    """
+    httpx.AsyncClient dùng chung cho Eneba, auth và Google Sheets (httpx): pool theo số worker,
+    HTTP/2 nếu có gói h2; gzip/brotli được httpx tự thêm vào Accept-Encoding và giải nén.
+    """
+    http2 = settings.HTTP2_ENABLED
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.warning("HTTP/2 is enabled but package 'h2' is not installed (httpx[http2]); using HTTP/1.1.")
+        http2 = False
+
+    max_connections = settings.HTTP_MAX_CONNECTIONS
+    logging.info(f"Shared HTTP client pool init: max {max_connections} connections, HTTP/2: {http2}.")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.http_timeout(settings.HTTP_TIMEOUT),
+        event_hooks={"request": [http_stats.on_request]},
+    )
 
 
 async def main():
     """
     Hàm async chính: Khởi tạo các client và chạy vòng lặp vô hạn.
     """
-    connection_limits = httpx.Limits(max_keepalive_connections=5, max_connections=10)
-
-    # Thêm một khóa (Semaphore(1))
-    google_sheets_lock = asyncio.Semaphore(1)
+    http_stats = HttpConnectionStats()
 
-    async with httpx.AsyncClient(limits=connection_limits, timeout=30.0) as shared_http_client:
-        logging.info("Shared HTTP client pool init.")
+    async with build_http_client(http_stats) as shared_http_client:
 
-        g_client = GoogleSheetsClient(settings.GOOGLE_KEY_PATH)
-        sheet_service = SheetService(client=g_client)
+        g_client = build_sheets_client(shared_http_client)
+        # Bộ điều phối quota thay cho khóa toàn cục: read/write token bucket + ưu tiên + backoff 429
+        account_count = len(g_client) if isinstance(g_client, SheetsAccountPool) else 1
+        sheets_scheduler = SheetsRequestScheduler(account_count=account_count)
+        sheet_service = SheetService(client=g_client, scheduler=sheets_scheduler)
 
         eneba_client = EnebaClient(http_client=shared_http_client)
+        try:
+            await eneba_client.warm_up()
+        except Exception as e:
+            logging.warning(f"Cannot acquire Eneba token at startup, will retry on first request: {e}")
         eneba_service = EnebaService(eneba_client=eneba_client)
 
         processor = Processor(eneba_service=eneba_service)
 
-        while True:
-            try:
-                logging.info("===== New round =====")
-                # Truyền khóa vào
-                await run_automation(sheet_service, processor, google_sheets_lock)
-
-                logging.info(f"Complete the round, next round in {settings.SLEEP_TIME} seconds.")
-                await asyncio.sleep(settings.SLEEP_TIME)
+        log_writer = SheetLogWriter(sheet_service=sheet_service)
+        log_writer.start()
 
-            except Exception as e:
-                logging.critical(f"Error in main, retry in 30s: {e}", exc_info=True)
-                await asyncio.sleep(30)
+        try:
+            while True:
+                try:
+                    logging.info("===== New round =====")
+                    await run_automation(sheet_service, processor, log_writer, http_stats)
+
+                    logging.info(f"Complete the round, next round in {settings.SLEEP_TIME} seconds.")
+                    await asyncio.sleep(settings.SLEEP_TIME)
+
+                except Exception as e:
+                    logging.critical(f"Error in main, retry in 30s: {e}", exc_info=True)
+                    await asyncio.sleep(30)
+        finally:
+            await log_writer.close()
+            await g_client.close()
 
 
 if __name__ == "__main__":
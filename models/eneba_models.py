@@ -45,10 +45,23 @@ class CompetitionEdge(BaseModel):
     node: CompetitionNode
 
 
+class PageInfo(BaseModel):
+    has_next_page: bool = Field(alias="hasNextPage")
+    end_cursor: Optional[str] = Field(default=None, alias="endCursor")
+
+
 class CompetitionData(BaseModel):
     total_count: int = Field(alias="totalCount")
+    page_info: Optional[PageInfo] = Field(default=None, alias="pageInfo")
     edges: List[CompetitionEdge]
 
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """Cursor của trang kế tiếp, None nếu đã hết (hoặc query không phân trang)."""
+        if self.page_info and self.page_info.has_next_page:
+            return self.page_info.end_cursor
+        return None
+
 
 class CompetitionResult(BaseModel):
     product_id: UUID = Field(alias="productId")
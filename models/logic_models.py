@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Callable
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from pydantic_core.core_schema import computed_field
 
 from models.eneba_models import CompetitionEdge
@@ -25,6 +25,21 @@ class PayloadResult(BaseModel):
     competition: list[CompetitionEdge] | None = None
     final_price: CompareTarget | None = None
     log_message: str | None = None
+    # Nội dung có ý nghĩa của log (không gồm timestamp), để biết note có thay đổi hay không
+    log_fingerprint: tuple | None = None
+
+    _log_renderer: Callable[[], str] | None = PrivateAttr(default=None)
+
+    def with_log_renderer(self, fingerprint: tuple, renderer: Callable[[], str]) -> "PayloadResult":
+        """Log chỉ được dựng khi thật sự cần ghi (render_log_message)."""
+        self.log_fingerprint = fingerprint
+        self._log_renderer = renderer
+        return self
+
+    def render_log_message(self) -> str | None:
+        if self.log_message is None and self._log_renderer is not None:
+            self.log_message = self._log_renderer()
+        return self.log_message
 
 
 class CommissionPrice(BaseModel):
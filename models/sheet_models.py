@@ -1,6 +1,8 @@
 # models/sheet_models.py
 import logging
-from typing import Annotated, List, Optional, ClassVar, Dict, Any
+import operator
+import types
+from typing import Annotated, List, Optional, ClassVar, Dict, Any, Tuple, Union, Callable, get_args, get_origin
 
 from pydantic import BaseModel, ValidationError, computed_field
 
@@ -13,11 +15,39 @@ def _col_to_index(col_name: str) -> int:
     return index - 1
 
 
+def _index_to_col(index: int) -> str:
+    """Convert a zero-based column index back to its letter (0 -> 'A', 26 -> 'AA')."""
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+_CELL_TYPES = {str, type(None)}
+
+
+def _scalar_type(annotation: Any) -> Optional[type]:
+    """Trả về str/int/float nếu annotation là kiểu đó (hoặc Optional của nó), ngược lại None."""
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    return annotation if annotation in (str, int, float) else None
+
+
 class BaseGSheetModel(BaseModel):
     row_index: int
 
     _index_map: ClassVar[Optional[Dict[str, int]]] = None
     _col_map: ClassVar[Optional[Dict[str, str]]] = None
+    _decoder: ClassVar[Optional[List[Tuple[str, int, Optional[type], bool]]]] = None
+    _construct_defaults: ClassVar[Optional[Dict[str, Any]]] = None
+    _field_names: ClassVar[List[str]] = []
+    _max_col_index: ClassVar[int] = 0
+    _row_getter: ClassVar[Optional[Callable]] = None
+    _required_fields: ClassVar[List[str]] = []
+    _typed_fields: ClassVar[List[Tuple[str, type]]] = []
 
     @classmethod
     def _build_maps_if_needed(cls):
@@ -41,32 +71,162 @@ class BaseGSheetModel(BaseModel):
         # logging.info(f"Built index map: {cls._index_map}")
 
     @classmethod
-    def from_row(cls, row_data: List[str], row_index: int) -> Optional['BaseGSheetModel']:
+    def _build_decoder_if_needed(cls):
+        """Biên dịch một lần danh sách (field, chỉ số cột, kiểu, bắt buộc) để decode hàng nhanh."""
+        if cls._decoder is not None:
+            return
         cls._build_maps_if_needed()
+        cls._decoder = [
+            (field_name, col_index, _scalar_type(cls.model_fields[field_name].annotation),
+             cls.model_fields[field_name].is_required())
+            for field_name, col_index in cls._index_map.items()
+        ]
+        cls._field_names = [entry[0] for entry in cls._decoder]
+        cls._max_col_index = max(entry[1] for entry in cls._decoder)
+        cls._row_getter = operator.itemgetter(*[entry[1] for entry in cls._decoder])
+        cls._required_fields = [entry[0] for entry in cls._decoder if entry[3]]
+        cls._typed_fields = [(entry[0], entry[2]) for entry in cls._decoder if entry[2] in (int, float)]
+        if any(field_info.default_factory is not None for field_info in cls.model_fields.values()):
+            cls._construct_defaults = None
+        else:
+            cls._construct_defaults = {
+                field_name: field_info.default
+                for field_name, field_info in cls.model_fields.items() if not field_info.is_required()
+            }
 
-        data_dict = {}
-        for field_name, col_index in cls._index_map.items():
-            if col_index < len(row_data):
-                value = row_data[col_index]
-                data_dict[field_name] = value if value != '' else None
+    @classmethod
+    def _fast_construct(cls, data_dict: Dict[str, Any]) -> 'BaseGSheetModel':
+        """Như model_construct nhưng dùng bảng default dựng sẵn (model_construct chậm hơn ~30 lần)."""
+        if cls._construct_defaults is None:
+            return cls.model_construct(**data_dict)
+        model = cls.__new__(cls)
+        values = cls._construct_defaults.copy()
+        values.update(data_dict)
+        object.__setattr__(model, '__dict__', values)
+        object.__setattr__(model, '__pydantic_fields_set__', set(data_dict))
+        object.__setattr__(model, '__pydantic_extra__', None)
+        object.__setattr__(model, '__pydantic_private__', None)
+        return model
 
-        if not any(data_dict.values()):
-            return None
+    @classmethod
+    def decode_row(
+            cls,
+            row_data: List[Any],
+            row_index: int,
+            required_values: Optional[Dict[str, str]] = None
+    ) -> Tuple[Optional['BaseGSheetModel'], Optional['RowRejection']]:
+        """
+        Decode một hàng thành model.
+        Đường nhanh: chuyển kiểu trực tiếp rồi dựng model, không chạy validate của pydantic.
+        Giá trị nào không chuyển được theo đường nhanh thì dùng model_validate như cũ.
+
+        Args:
+            required_values: nếu có, hàng có giá trị khác ở các cột này bị bỏ qua ngay,
+                             không tạo model (ví dụ {'is_check_enabled_str': '1'}).
+
+        Returns:
+            (model, None) nếu hợp lệ; (None, RowRejection) nếu hàng bị loại do dữ liệu sai;
+            (None, None) nếu hàng trống hoặc bị bỏ qua bởi required_values.
+        """
+        cls._build_decoder_if_needed()
+        row_length = len(row_data)
+
+        if required_values:
+            for field_name, expected in required_values.items():
+                col_index = cls._index_map[field_name]
+                if col_index >= row_length or row_data[col_index] != expected:
+                    return None, None
+
+        if row_length > cls._max_col_index:
+            # Hàng đủ dài: lấy tất cả các cột một lần (itemgetter), rồi chỉ xử lý riêng các cột số
+            values = cls._row_getter(row_data)
+            has_value = any(values)
+            data_dict = {name: (value if value != '' else None) for name, value in zip(cls._field_names, values)}
+            # Ô không phải chuỗi (hiếm, chỉ khi đọc UNFORMATTED) thì để pydantic validate
+            needs_validation = (not _CELL_TYPES.issuperset(map(type, values))
+                                or any(data_dict[name] is None for name in cls._required_fields))
+            for field_name, field_type in cls._typed_fields:
+                value = data_dict[field_name]
+                if value is None:
+                    continue
+                try:
+                    data_dict[field_name] = field_type(value)
+                except (ValueError, TypeError):
+                    needs_validation = True
+        else:
+            data_dict, has_value, needs_validation = cls._decode_short_row(row_data, row_length)
+
+        if not has_value:
+            return None, None
 
         data_dict['row_index'] = row_index
+        if not needs_validation:
+            return cls._fast_construct(data_dict), None
 
         try:
-            return cls.model_validate(data_dict)
+            return cls.model_validate(data_dict), None
         except ValidationError as e:
             product_name_index = cls._index_map.get("product_name")
-            name_for_log = ""
-            if product_name_index is not None and product_name_index < len(row_data):
-                name_for_log = row_data[product_name_index] or f"Hàng {row_index}"
+            if product_name_index is not None and product_name_index < row_length and row_data[product_name_index]:
+                name_for_log = str(row_data[product_name_index])
             else:
                 name_for_log = f"Hàng {row_index}"
+            reason = "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            return None, RowRejection(row_index=row_index, name=name_for_log, reason=reason)
 
-            # logging.warning(f"Ignoring row {row_index} ({name_for_log}) due to validation error: {e}")
-            return None
+    @classmethod
+    def _decode_short_row(cls, row_data: List[Any], row_length: int) -> Tuple[Dict[str, Any], bool, bool]:
+        """Hàng ngắn hơn số cột của model: các cột thiếu không được đưa vào dict (giống from_row cũ)."""
+        data_dict = {}
+        has_value = False
+        needs_validation = False
+        for field_name, col_index, field_type, required in cls._decoder:
+            if col_index >= row_length:
+                needs_validation = needs_validation or required
+                continue
+            value = row_data[col_index]
+            if value == '' or value is None:
+                data_dict[field_name] = None
+                needs_validation = needs_validation or required
+                continue
+
+            has_value = True
+            if field_type is str and isinstance(value, str):
+                data_dict[field_name] = value
+                continue
+            if field_type in (float, int) and isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                try:
+                    data_dict[field_name] = field_type(value)
+                    continue
+                except ValueError:
+                    pass
+            data_dict[field_name] = value
+            needs_validation = True
+        return data_dict, has_value, needs_validation
+
+    @classmethod
+    def from_row(cls, row_data: List[str], row_index: int) -> Optional['BaseGSheetModel']:
+        return cls.decode_row(row_data, row_index)[0]
+
+
+class RowRejection(BaseModel):
+    row_index: int
+    name: str
+    reason: str
+
+
+class SheetWriteStats(BaseModel):
+    rows: int = 0
+    cells: int = 0
+    ranges: int = 0
+    requests: int = 0
+    saved_requests: int = 0
+    saved_ranges: int = 0
+    suppressed_rows: int = 0
+    # Số hàng không ghi được (batchUpdate lỗi); fingerprint của chúng bị quên để vòng sau ghi lại
+    failed_rows: int = 0
 
 
 class SheetLocation(BaseModel):
@@ -98,7 +258,7 @@ class Payload(BaseGSheetModel):
     sheet_max: Annotated[Optional[str], "T"] = None
     cell_max: Annotated[Optional[str], "U"] = None
     idsheet_stock: Annotated[Optional[str], "V"] = None
-    sheet_stock: Annotated[Optional[str], "Ư"] = None
+    sheet_stock: Annotated[Optional[str], "W"] = None
     cell_stock: Annotated[Optional[str], "X"] = None
     idsheet_blacklist: Annotated[Optional[str], "Y"] = None
     sheet_blacklist: Annotated[Optional[str], "Z"] = None
@@ -110,6 +270,8 @@ class Payload(BaseGSheetModel):
     fetched_max_price: Optional[float] = None
     fetched_stock: Optional[int] = None
     fetched_black_list: Optional[List[str]] = None
+    # True khi có dải ô min/max/blacklist của hàng không đọc được trong vòng này
+    hydration_failed: bool = False
     prod_uuid: Optional[str] = None
     offer_id: Optional[str] = None
     current_price: Optional[float] = None
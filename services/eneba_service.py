@@ -1,121 +1,369 @@
-import copy
+import asyncio
+import logging
 import re
-from typing import List
+from typing import List, Dict, Iterable, Optional, Tuple
 from uuid import UUID
 
+from clients.base_graphql_client import _has_rate_limit_error
+from clients.exceptions import GraphQLError
 from clients.impl.eneba_client import EnebaClient
-from models.eneba_models import CompetitionEdge
+from logic.commission_model import CommissionModel
+from logic.competition_snapshot import CompetitionSnapshot, merchant_ids
+from models.eneba_models import CompetitionData, CompetitionEdge
 from models.logic_models import AnalysisResult, CommissionPrice
 from models.sheet_models import Payload
+from utils.config import settings
+from utils.cache import TTLCache, MISSING
+from utils.slug_cache import SlugCache
 
 
 class EnebaService:
     def __init__(self, eneba_client: EnebaClient):
         self._client = eneba_client
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # slug -> product id không đổi nên được lưu trên đĩa và dùng chung giữa các vòng
+        self._slug_cache = SlugCache(settings.SLUG_CACHE_PATH)
+        # (product id, amount cents, currency) -> CommissionPrice
+        self._commission_cache = TTLCache(settings.COMMISSION_CACHE_MAX_ENTRIES, settings.COMMISSION_CACHE_TTL)
+        # Mô hình commission học từ S_calculatePrice để trả lời cục bộ khi đủ tin cậy
+        self._commission_model = CommissionModel(
+            min_samples=settings.COMMISSION_MODEL_MIN_SAMPLES,
+            tolerance_cents=settings.COMMISSION_MODEL_TOLERANCE_CENTS,
+            revalidate_every=settings.COMMISSION_MODEL_REVALIDATE_EVERY,
+            max_gap_ratio=settings.COMMISSION_MODEL_MAX_GAP_RATIO,
+            path=settings.COMMISSION_MODEL_PATH or None,
+        ) if settings.COMMISSION_MODEL_ENABLED else None
+        # Prefetch cho một vòng: slug -> competition (chưa lọc)
+        self._competition_prefetch: Dict[str, CompetitionSnapshot] = {}
+        # Phân trang S_competition chỉ đúng khi API trả người bán theo giá tăng dần;
+        # bị tắt (đến khi khởi động lại) nếu API từ chối first/after hoặc trả về trang không sắp theo giá
+        self._competition_paging = settings.COMPETITION_PAGE_SIZE > 0
+
+    async def resolve_product_ids(self, slugs: Iterable[str]) -> Dict[str, UUID]:
+        """
+        Resolve nhiều slug -> product id. Slug đã có trong cache không cần gọi API;
+        các slug còn thiếu được hỏi gộp qua S_products (tối đa SLUG_RESOLVE_BATCH_SIZE slug mỗi request).
+
+        Returns:
+            Map slug -> product id cho các slug tìm được.
+        """
+        slugs = list(dict.fromkeys(slugs))
+        missing = self._slug_cache.missing(slugs)
+        if missing:
+            batch_size = max(1, settings.SLUG_RESOLVE_BATCH_SIZE)
+            chunks = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            results = await asyncio.gather(*(self._resolve_slug_chunk(chunk) for chunk in chunks))
+
+            resolved: Dict[str, UUID] = {}
+            for chunk_resolved, _ in results:
+                resolved.update(chunk_resolved)
+            self._slug_cache.update(resolved)
+            self.logger.info(
+                f"Resolved {len(resolved)}/{len(missing)} new slugs in {sum(r for _, r in results)} requests "
+                f"({len(slugs) - len(missing)} from cache).")
+            unresolved = [slug for slug in missing if slug not in resolved]
+            if unresolved:
+                self.logger.warning(f"Cannot resolve product id for {len(unresolved)} slugs: {unresolved}")
+
+        return {slug: self._slug_cache.get(slug) for slug in slugs if slug in self._slug_cache}
+
+    async def _resolve_slug_chunk(self, slugs: List[str]) -> Tuple[Dict[str, UUID], int]:
+        """
+        Resolve một nhóm slug qua S_products. Một slug có thể khớp nhiều sản phẩm và chiếm hết `first`
+        kết quả, đẩy các slug khác ra ngoài: khi trang trả về đầy, các slug chưa tìm thấy được hỏi lại.
+
+        Returns:
+            (map slug -> product id, số request đã gửi)
+        """
+        resolved: Dict[str, UUID] = {}
+        pending = slugs
+        requests = 0
+        while pending:
+            first = len(pending) * max(1, settings.SLUG_RESOLVE_RESULTS_PER_SLUG)
+            res = await self._client.get_products_by_slugs(pending, first=first)
+            requests += 1
+            try:
+                edges = res.data.s_products.edges
+            except AttributeError as e:
+                raise ValueError(f"Invalid response structure: {e}") from e
+            wanted = set(pending)
+            for edge in edges:
+                # Kết quả sắp xếp CREATED_AT_DESC: giữ sản phẩm mới nhất nếu trùng slug
+                if edge.node.slug in wanted:
+                    resolved.setdefault(edge.node.slug, edge.node.id)
+            remaining = [slug for slug in pending if slug not in resolved]
+            # Trang chưa đầy: các slug còn lại thật sự không tồn tại; không tiến triển: dừng để tránh lặp vô hạn
+            if len(edges) < first or len(remaining) == len(pending):
+                break
+            pending = remaining
+        return resolved, requests
 
     async def get_product_id_by_slug(self, slugs: str) -> UUID:
-        res = await self._client.get_product_by_slug(slugs)
-        try:
-            response_data = res.data.s_products.edges
-            if not response_data or len(response_data) == 0:
-                raise ValueError(f"No products found for slug: {slugs}")
-            return response_data[0].node.id
-        except AttributeError as e:
-            raise ValueError(f"Invalid response structure: {e}") from e
+        product_ids = await self.resolve_product_ids([slugs])
+        if slugs not in product_ids:
+            raise ValueError(f"No products found for slug: {slugs}")
+        return product_ids[slugs]
 
-    async def get_competition_by_product_id(self, product_id: UUID) -> List[CompetitionEdge]:
-        res = await self._client.get_competition_by_product_id(product_id)
+    def _disable_competition_paging(self, reason: str):
+        if self._competition_paging:
+            self.logger.warning(f"Disabling S_competition pagination, fetching full seller lists: {reason}")
+            self._competition_paging = False
+
+    async def get_competition_by_product_id(self, product_id: UUID, after: Optional[str] = None,
+                                            paged: bool = False) -> CompetitionData:
+        res = await self._client.get_competition_by_product_id(product_id, after=after, paged=paged)
         try:
             response_data = res.data.s_competition
             if not response_data or len(response_data) == 0:
                 raise ValueError(f"No competition data found for product ID: {product_id}")
-            return response_data[0].competition.edges
+            return response_data[0].competition
         except AttributeError as e:
             raise ValueError(f"Invalid response structure: {e}") from e
 
-    async def get_competition_by_slug(self, slug: str) -> List[CompetitionEdge]:
-        product_id = await self.get_product_id_by_slug(slug)
-        if not product_id:
-            raise ValueError(f"Product ID not found for slug: {slug}")
-
-        products = await self.get_competition_by_product_id(product_id)
-        if not products:
-            raise ValueError(f"No competition data found for product ID: {product_id}")
-
-        filtered_and_adjusted_products = []
-        for product in products:
-            if product.node.is_in_stock and product.node.price.amount > 0:
-                product_copy = copy.deepcopy(product)
-                product_copy.node.price.amount /= 100
-                filtered_and_adjusted_products.append(product_copy)
-
-        return filtered_and_adjusted_products
-
-    def _filter_products_by_criteria(self, payload: Payload, products: List[CompetitionEdge]) -> List[CompetitionEdge]:
-        """Filter products based on blacklist and price range criteria."""
-        filtered_products = []
-        for product in products:
-            if product.node.merchant_name not in payload.fetched_black_list and product.node.price.amount > 0:
-                if payload.fetched_min_price is not None and product.node.price.amount < payload.fetched_min_price:
-                    continue
-                if payload.fetched_max_price is not None and product.node.price.amount > payload.fetched_max_price:
-                    continue
-                filtered_products.append(product)
-        return filtered_products
+    async def get_competition_by_product_ids(self, product_ids: Iterable[UUID]) -> Dict[UUID, CompetitionSnapshot]:
+        """
+        Lấy competition cho nhiều sản phẩm, mỗi request tối đa COMPETITION_BATCH_SIZE productIds.
+
+        Returns:
+            Map product id -> competition (snapshot rỗng nếu API không trả về sản phẩm đó).
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        batch_size = max(1, settings.COMPETITION_BATCH_SIZE)
+        chunks = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+        responses = await asyncio.gather(*(self._fetch_competition_chunk(chunk) for chunk in chunks))
+
+        competition: Dict[UUID, CompetitionSnapshot] = {
+            product_id: CompetitionSnapshot.from_edges([], product_id=product_id) for product_id in unique_ids
+        }
+        for res in responses:
+            try:
+                for result in res.data.s_competition:
+                    competition[result.product_id] = CompetitionSnapshot.from_competition(
+                        result.product_id, result.competition)
+            except AttributeError as e:
+                raise ValueError(f"Invalid response structure: {e}") from e
+
+        # Trang đầu không sắp theo giá: người bán rẻ hơn có thể nằm ở trang sau, lấy lại toàn bộ danh sách
+        unsorted = [product_id for product_id, snapshot in competition.items()
+                    if snapshot.next_cursor and not snapshot.is_price_sorted()]
+        if unsorted:
+            self._disable_competition_paging(f"sellers of {len(unsorted)} products are not sorted by price")
+            competition.update(await self.get_competition_by_product_ids(unsorted))
+        return competition
+
+    async def _fetch_competition_chunk(self, chunk: List[UUID]):
+        if self._competition_paging:
+            try:
+                return await self._client.get_competition_by_product_ids(chunk, paged=True)
+            except GraphQLError as e:
+                if _has_rate_limit_error(e.errors):
+                    raise
+                self._disable_competition_paging(f"paged query rejected: {e}")
+        return await self._client.get_competition_by_product_ids(chunk, paged=False)
+
+    async def prefetch_competition(self, payloads: List[Payload]):
+        """
+        Lấy trước product id và competition cho cả lô payload bằng các request gộp,
+        để get_competition_by_slug / get_product_id_by_slug không phải gọi API cho từng hàng.
+        """
+        slugs = []
+        for payload in payloads:
+            if not payload.is_compare_enabled or not payload.product_compare:
+                continue
+            try:
+                slug = self.get_slug_from_url(payload.product_compare)
+            except ValueError as e:
+                self.logger.warning(f"Row {payload.row_index}: {e}")
+                continue
+            if slug not in self._competition_prefetch:
+                slugs.append(slug)
+        slugs = list(dict.fromkeys(slugs))
+        if not slugs:
+            return
+
+        product_ids = await self.resolve_product_ids(slugs)
+        slug_by_id = {product_id: slug for slug, product_id in product_ids.items()}
+        competition = await self.get_competition_by_product_ids(slug_by_id.keys())
+        for product_id, snapshot in competition.items():
+            self._competition_prefetch[slug_by_id[product_id]] = snapshot
+        self.logger.info(
+            f"Prefetched competition for {len(competition)} products in "
+            f"{-(-len(competition) // max(1, settings.COMPETITION_BATCH_SIZE))} requests.")
+
+    def clear_prefetch(self):
+        """Xóa dữ liệu prefetch của vòng trước (cache slug vẫn được giữ)."""
+        self._competition_prefetch.clear()
+
+    async def get_competition_by_slug(self, slug: str) -> CompetitionSnapshot:
+        """Người bán còn hàng, giá > 0 của sản phẩm (giá lưu theo cent, không copy edge nào)."""
+        if slug in self._competition_prefetch:
+            snapshot = self._competition_prefetch[slug]
+            if not len(snapshot):
+                raise ValueError(f"No competition data found for slug: {slug}")
+        else:
+            product_id = await self.get_product_id_by_slug(slug)
+            if not product_id:
+                raise ValueError(f"Product ID not found for slug: {slug}")
+
+            snapshot = (await self.get_competition_by_product_ids([product_id]))[product_id]
+            if not len(snapshot):
+                raise ValueError(f"No competition data found for product ID: {product_id}")
+
+        snapshot = snapshot.available()
+        pages = 1
+        # Cả trang đầu đều hết hàng: lấy tiếp trang sau
+        while not len(snapshot) and snapshot.next_cursor and pages < settings.COMPETITION_MAX_PAGES:
+            snapshot = await self.get_next_competition_page(snapshot)
+            pages += 1
+        return snapshot
+
+    async def get_next_competition_page(self, snapshot: CompetitionSnapshot) -> CompetitionSnapshot:
+        """
+        Lấy trang người bán kế tiếp (chỉ giữ người còn hàng, giá > 0) và nối vào sau snapshot.
+        Nếu phân trang không dùng được nữa, trả về toàn bộ danh sách (thứ tự người bán có thể khác snapshot cũ).
+        """
+        if self._competition_paging:
+            try:
+                competition = await self.get_competition_by_product_id(
+                    snapshot.product_id, after=snapshot.next_cursor, paged=True)
+                extended = snapshot.extend(
+                    CompetitionSnapshot.from_competition(snapshot.product_id, competition).available())
+                if extended.is_price_sorted():
+                    return extended
+                self._disable_competition_paging("sellers are not sorted by price across pages")
+            except GraphQLError as e:
+                if _has_rate_limit_error(e.errors):
+                    raise
+                self._disable_competition_paging(f"paged query rejected: {e}")
+
+        competition = await self.get_competition_by_product_id(snapshot.product_id)
+        return CompetitionSnapshot.from_competition(snapshot.product_id, competition).available()
 
     async def enrich_products_with_commission(self, payload: Payload, products: List[CompetitionEdge], limit: int = 4) -> List[CompetitionEdge]:
         """Enrich first N products with commission price calculations."""
-        for i, product in enumerate(products[:limit]):
-            price_obj = await self.calculate_commission_price(payload.prod_uuid, product.node.price.amount)
+        # Các lần tính commission còn thiếu trong cache được gửi song song
+        price_objs = await asyncio.gather(*(
+            self.calculate_commission_price(payload.prod_uuid, product.node.price.amount)
+            for product in products[:limit]
+        ))
+        for product, price_obj in zip(products[:limit], price_objs):
             product.node.price.price_no_commission = price_obj.get_price_without_commission()
             product.node.price.old_price_with_commission = product.node.price.amount
             product.node.price.amount = price_obj.get_price_without_commission()
         return products
 
-    async def _filter_products(self, payload: Payload, products: List[CompetitionEdge]) -> List[CompetitionEdge]:
-        filtered_products = self._filter_products_by_criteria(payload, products)
-        return filtered_products
+    async def analyze_competition(self, payload: Payload, snapshot: CompetitionSnapshot,
+                                  limit: int = 4) -> AnalysisResult:
+        net_amounts: Dict[int, float] = {}
+        blacklist = merchant_ids(payload.fetched_black_list or [])
+        pages = 1
+        while True:
+            # `limit` người bán đầu tiên được quy về giá net (trừ commission) như trước khi lọc
+            head = [i for i in range(min(limit, len(snapshot))) if i not in net_amounts]
+            price_objs = await asyncio.gather(*(
+                self.calculate_commission_price(payload.prod_uuid, snapshot.amount(i)) for i in head
+            ))
+            net_amounts.update(
+                (i, price_obj.get_price_without_commission()) for i, price_obj in zip(head, price_objs))
+
+            amounts = [net_amounts.get(i, price / 100) for i, price in enumerate(snapshot.prices)]
+            filtered = snapshot.filter_indexes(
+                amounts,
+                blacklist,
+                payload.fetched_min_price,
+                payload.fetched_max_price,
+            )
+            # Mọi người bán đã lấy đều bị loại (blacklist/min/max): lấy thêm trang sau nếu còn
+            if filtered or not snapshot.next_cursor or pages >= settings.COMPETITION_MAX_PAGES:
+                break
+            try:
+                snapshot = await self.get_next_competition_page(snapshot)
+                # Snapshot có thể là danh sách đầy đủ theo thứ tự khác: tính lại giá net của các người bán đầu
+                # (S_calculatePrice đã được cache nên không tốn thêm request)
+                net_amounts.clear()
+            except Exception as e:
+                self.logger.warning(f"Cannot fetch next competition page for {payload.product_compare}: {e}")
+                break
+            pages += 1
+        head = range(min(limit, len(snapshot)))
+
+        def _edge(i: int) -> CompetitionEdge:
+            if i not in net_amounts:
+                return snapshot.to_edge(i)
+            edge = snapshot.to_edge(i, amount=net_amounts[i])
+            edge.node.price.price_no_commission = net_amounts[i]
+            edge.node.price.old_price_with_commission = snapshot.amount(i)
+            return edge
 
-    async def analyze_competition(self, payload: Payload, products: List[CompetitionEdge]) -> AnalysisResult:
-        top_sellers_for_log = products[:4]
-        sellers_below_min = []
-        # Thêm await
-        top_sellers_for_log = await self.enrich_products_with_commission(payload, top_sellers_for_log)
-        filtered_products = await self._filter_products(payload, products)
         competitive_price = payload.fetched_max_price
         competitor_name = "Not found"
-        if len(filtered_products) > 0:
-            filtered_products.sort(key=lambda x: x.node.price.amount)
-            competitive_price = filtered_products[0].node.price.amount
-            competitor_name = filtered_products[0].node.merchant_name
+        sellers_below_min = []
+        if filtered:
+            best = min(filtered, key=amounts.__getitem__)
+            competitive_price = amounts[best]
+            competitor_name = snapshot.merchant_name(best)
 
-            for product in filtered_products:
-                if product.node.price.amount < payload.fetched_min_price:
-                    sellers_below_min.append(product)
+            if payload.fetched_min_price is not None:
+                below_min = [i for i in filtered if amounts[i] < payload.fetched_min_price]
+                # Log chỉ dùng 6 người bán rẻ nhất dưới min_price
+                sellers_below_min = [_edge(i) for i in snapshot.cheapest(below_min, amounts, 6)]
 
         return AnalysisResult(
             competitor_name=competitor_name,
             competitive_price=competitive_price,
-            top_sellers_for_log=top_sellers_for_log,
+            top_sellers_for_log=[_edge(i) for i in head],
             sellers_below_min=sellers_below_min
         )
 
     async def calculate_commission_price(self, prodId: str, amount: float, currency: str = "EUR") -> CommissionPrice:
         price = int(amount * 100)
+        cache_key = (str(prodId), price, currency)
+        cached = self._commission_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+
+        if self._commission_model:
+            predicted = self._commission_model.predict(f"{prodId}:{currency}", price)
+            if predicted is not None:
+                commission_price = CommissionPrice(price_without_commission=predicted[0],
+                                                   price_with_commission=predicted[1])
+                self._commission_cache.set(cache_key, commission_price)
+                return commission_price
+
         res = await self._client.calculate_price(product_id=prodId, amount=price, currency=currency)
-        commission_price = CommissionPrice(
-            price_without_commission=res.data.s_calculate_price.price_without_commission.amount,
-            price_with_commission=res.data.s_calculate_price.price_with_commission.amount,
-        )
         try:
-            return commission_price
+            commission_price = CommissionPrice(
+                price_without_commission=res.data.s_calculate_price.price_without_commission.amount,
+                price_with_commission=res.data.s_calculate_price.price_with_commission.amount,
+            )
         except AttributeError as e:
             raise ValueError(f"Invalid response structure: {e}") from e
+        self._commission_cache.set(cache_key, commission_price)
+        if self._commission_model:
+            self._commission_model.record(f"{prodId}:{currency}", price, commission_price.price_without_commission,
+                                          commission_price.price_with_commission)
+        return commission_price
+
+    def commission_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {"cache": self._commission_cache.stats()}
+        if self._commission_model:
+            stats["model"] = self._commission_model.stats()
+        return stats
+
+    def graphql_stats(self, reset: bool = False) -> dict:
+        return self._client.graphql_stats(reset=reset)
+
+    def save_commission_model(self):
+        if self._commission_model:
+            self._commission_model.save()
 
     async def update_product_price(self, offer_id: str, new_price: float) -> bool:
         price = int(new_price * 100)
         res = await self._client.update_auction(auction_id=offer_id, amount=price)
-        return res.data.s_update_auction.success
+        result = res.data.s_update_auction
+        self.logger.info(f"Offer {offer_id}: success={result.success}, priceChanged={result.price_changed}, "
+                         f"paidForPriceChange={result.paid_for_price_change}")
+        return result.success
 
     async def check_next_free_in_minutes(self, payload: Payload) -> tuple[Payload, int, int] | tuple[int, int]:
         """
@@ -159,6 +407,16 @@ class EnebaService:
             # If it has a value, convert from seconds to minutes (rounding down)
             return payload, quota_info.next_free_in // 60, 0
 
+    # Hàm này không làm I/O, chỉ xử lý chuỗi, nên giữ nguyên là sync (đồng bộ)
+    def get_slug_from_url(self, url: str) -> str:
+        """'https://www.eneba.com/<slug>' -> '<slug>' (giữ nguyên nếu đã là slug)."""
+        parts = url.replace("https://", "").replace("http://", "").strip("/").split("/")
+        if len(parts) == 1 and parts[0]:
+            return parts[0]
+        if len(parts) < 2 or not parts[1]:
+            raise ValueError(f"Invalid URL format, cannot extract product slug: {url}")
+        return parts[1]
+
     # Hàm này không làm I/O, chỉ xử lý chuỗi, nên giữ nguyên là sync (đồng bộ)
     def get_offer_id_by_url(self, url: str) -> str:
         pattern = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
@@ -0,0 +1,196 @@
+# services/sheet_log_writer.py
+import asyncio
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple, Optional, Callable, Hashable
+
+from models.sheet_models import Payload, SheetWriteStats, _col_to_index, _index_to_col
+from services.sheet_service import SheetService
+from utils.config import settings
+
+_CELL_RE = re.compile(r"^(?P<sheet>.+)!(?P<col>[A-Z]+)(?P<row>\d+)$")
+
+
+def _pack_cells(cells: Dict[Tuple[str, int, int], str]) -> List[Dict[str, Any]]:
+    """
+    Gộp các ô đơn lẻ thành các dải ô hình chữ nhật.
+    - Các cột liền nhau trên cùng một hàng (ví dụ E5, F5) -> E5:F5
+    - Các hàng liền nhau có cùng khoảng cột (E5:F5, E6:F6) -> E5:F6
+
+    Args:
+        cells: map (sheet_name, row, col_index) -> giá trị.
+
+    Returns:
+        Danh sách {'range': ..., 'values': ...} sẵn sàng cho batchUpdate.
+    """
+    rows_by_sheet: Dict[str, Dict[int, Dict[int, str]]] = defaultdict(lambda: defaultdict(dict))
+    for (sheet_name, row, col), value in cells.items():
+        rows_by_sheet[sheet_name][row][col] = value
+
+    packed = []
+    for sheet_name, rows in rows_by_sheet.items():
+        # (start_col, end_col) -> [(row, [values...]), ...]
+        segments: Dict[Tuple[int, int], List[Tuple[int, List[str]]]] = defaultdict(list)
+        for row in sorted(rows):
+            cols = sorted(rows[row])
+            start = prev = cols[0]
+            for col in cols[1:] + [None]:
+                if col is not None and col == prev + 1:
+                    prev = col
+                    continue
+                segments[(start, prev)].append((row, [rows[row][c] for c in range(start, prev + 1)]))
+                if col is not None:
+                    start = prev = col
+
+        for (start_col, end_col), segment_rows in segments.items():
+            block_start, block_values = segment_rows[0][0], [segment_rows[0][1]]
+            for row, values in segment_rows[1:] + [(None, None)]:
+                if row is not None and row == block_start + len(block_values):
+                    block_values.append(values)
+                    continue
+                block_end = block_start + len(block_values) - 1
+                cell_range = f"{sheet_name}!{_index_to_col(start_col)}{block_start}"
+                if block_end != block_start or end_col != start_col:
+                    cell_range += f":{_index_to_col(end_col)}{block_end}"
+                packed.append({'range': cell_range, 'values': block_values})
+                if row is not None:
+                    block_start, block_values = row, [values]
+
+    return packed
+
+
+class SheetLogWriter:
+    """
+    Bộ đệm ghi log (write-behind) cho sheet chính.
+    Worker chỉ cần enqueue rồi trả về ngay; các cập nhật được gộp và gửi bằng một lần
+    values.batchUpdate khi đủ LOG_FLUSH_MAX_ROWS hàng, sau LOG_FLUSH_INTERVAL giây, hoặc cuối vòng.
+    """
+
+    def __init__(self, sheet_service: SheetService):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._sheet_service = sheet_service
+
+        self._pending: Dict[Tuple[str, int, int], str] = {}
+        self._pending_rows: set = set()
+        self._pending_requests = 0
+
+        # row_index -> (product_name, fingerprint, thời điểm ghi) của note gần nhất
+        self._last_notes: Dict[int, Tuple[str, Hashable, float]] = {}
+        self._suppressed = 0
+
+        self._flush_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, payload: Payload, log_data: Dict[str, Any]):
+        update_requests = payload.prepare_update(settings.MAIN_SHEET_NAME, log_data)
+        for request in update_requests:
+            match = _CELL_RE.match(request['range'])
+            if not match:
+                self.logger.warning(f"Cannot parse range '{request['range']}', skipping.")
+                continue
+            row = int(match.group('row'))
+            key = (match.group('sheet'), row, _col_to_index(match.group('col')))
+            self._pending[key] = request['values'][0][0]
+            self._pending_rows.add(row)
+
+        if update_requests:
+            self._pending_requests += 1
+            logging.debug(f"Row {payload.row_index} queued log update: {log_data}")
+
+        if len(self._pending_rows) >= settings.LOG_FLUSH_MAX_ROWS:
+            self._flush_event.set()
+
+    def enqueue_if_changed(
+            self,
+            payload: Payload,
+            fingerprint: Hashable,
+            build_log_data: Callable[[], Dict[str, Any]]
+    ) -> bool:
+        """
+        Chỉ dựng và enqueue log khi fingerprint khác lần ghi trước của hàng,
+        hoặc đã quá NOTE_HEARTBEAT_SECONDS kể từ lần ghi trước (để last_update vẫn được làm mới).
+
+        Returns:
+            True nếu log được enqueue, False nếu bị bỏ qua.
+        """
+        now = time.monotonic()
+        heartbeat = settings.NOTE_HEARTBEAT_SECONDS
+        last = self._last_notes.get(payload.row_index)
+        if (heartbeat > 0 and last is not None
+                and last[0] == payload.product_name
+                and last[1] == fingerprint
+                and now - last[2] < heartbeat):
+            self._suppressed += 1
+            logging.debug(f"Row {payload.row_index} note unchanged, skip writing.")
+            return False
+
+        self._last_notes[payload.row_index] = (payload.product_name, fingerprint, now)
+        self.enqueue(payload, build_log_data())
+        return True
+
+    async def flush(self) -> SheetWriteStats:
+        async with self._flush_lock:
+            self._flush_event.clear()
+            suppressed, self._suppressed = self._suppressed, 0
+            if not self._pending:
+                if suppressed:
+                    self.logger.info(f"Skipped {suppressed} unchanged notes, nothing to flush.")
+                return SheetWriteStats(suppressed_rows=suppressed)
+
+            cells, rows, requests = self._pending, self._pending_rows, self._pending_requests
+            self._pending, self._pending_rows, self._pending_requests = {}, set(), 0
+
+            update_requests = _pack_cells(cells)
+            try:
+                await self._sheet_service.batch_update_main_sheet(update_requests)
+            except Exception as e:
+                # Ghi thất bại: quên fingerprint để lần sau note được ghi lại, không bị bỏ qua nhầm
+                for row in rows:
+                    self._last_notes.pop(row, None)
+                self.logger.error(f"Cannot flush {len(cells)} cells of {len(rows)} rows, "
+                                  f"they will be rewritten next round: {e}")
+                return SheetWriteStats(failed_rows=len(rows), suppressed_rows=suppressed)
+            await self._sheet_service.record_main_sheet_write()
+
+            stats = SheetWriteStats(
+                rows=len(rows),
+                cells=len(cells),
+                ranges=len(update_requests),
+                requests=1,
+                saved_requests=requests - 1,
+                saved_ranges=len(cells) - len(update_requests),
+                suppressed_rows=suppressed,
+            )
+            self.logger.info(
+                f"Flushed {stats.cells} cells of {stats.rows} rows in {stats.ranges} ranges / 1 request "
+                f"(saved {stats.saved_requests} requests, {stats.saved_ranges} ranges; "
+                f"skipped {stats.suppressed_rows} unchanged notes).")
+            return stats
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=settings.LOG_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Cannot flush sheet log updates: {e}", exc_info=True)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
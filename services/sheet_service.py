@@ -1,14 +1,25 @@
 # services/sheet_service.py
+import asyncio
 import logging
 import re
+import time
 from collections import defaultdict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union, AsyncIterator
 
-from clients.google_sheets_client import GoogleSheetsClient
-from models.sheet_models import Payload, SheetLocation
+from clients.async_google_sheets_client import AsyncGoogleSheetsClient
+from clients.exceptions import SheetsRequestError, SheetsRateLimitError
+from clients.google_sheets_client import ThreadedGoogleSheetsClient
+from clients.sheets_scheduler import SheetsRequestScheduler, READ, WRITE, PRIORITY_HEADER, PRIORITY_HYDRATION, \
+    PRIORITY_LOG_WRITE
+from models.sheet_models import Payload, SheetLocation, RowRejection, _index_to_col
+from utils.cache import TTLCache, MISSING
 from utils.config import settings
 
 
+_LOG_FIELDS = ('note', 'last_update')
+_ENABLED_ROW = {'is_check_enabled_str': '1'}
+
+
 def _find_header_row(rows: List[List[str]], key_columns: List[str]) -> Optional[int]:
     """Find the index of the header row in the provided rows."""
     for i, row in enumerate(rows):
@@ -18,6 +29,14 @@ def _find_header_row(rows: List[List[str]], key_columns: List[str]) -> Optional[
     return None
 
 
+def _row_fingerprint(row_data: List[str], ignored_indexes: set) -> int:
+    """
+    Hash nội dung một hàng, bỏ qua các cột log (note/last_update) do chính bot ghi,
+    để việc ghi log không làm hàng bị coi là đã thay đổi.
+    """
+    return hash(tuple(value for index, value in enumerate(row_data) if index not in ignored_indexes))
+
+
 def _process_unbounded_range(range_str: str, limit: int = 1000) -> str:
     match = re.search(r":([A-Z]+)$", range_str, re.IGNORECASE)
     if match:
@@ -54,76 +73,400 @@ def _process_fetched_value(key: str, raw_value: Any) -> Optional[Any]:
         return None
 
 
+def _align_to_requested_ranges(requested: List[str], fetched: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    batchGet trả về valueRanges theo đúng thứ tự yêu cầu, nhưng range trả về có thể khác
+    range đã gửi (ví dụ 'A:A1000' -> 'A1:A1000'). Map lại theo vị trí khi số lượng khớp.
+    """
+    if len(requested) == len(fetched):
+        return dict(zip(requested, fetched.values()))
+    return fetched
+
+
+def _cache_ttl(key: str) -> float:
+    return {
+        "min_price": settings.SHEET_CACHE_TTL_MIN_PRICE,
+        "max_price": settings.SHEET_CACHE_TTL_MAX_PRICE,
+        "stock": settings.SHEET_CACHE_TTL_STOCK,
+        "black_list": settings.SHEET_CACHE_TTL_BLACKLIST,
+    }[key]
+
+
+def _payload_locations(payload: Payload) -> Dict[str, SheetLocation]:
+    # Chưa có chỗ nào dùng fetched_stock nên không đọc ô stock: tránh thêm range khi hydrate
+    # và tránh bỏ định giá cả hàng chỉ vì tham chiếu stock sai
+    return {
+        "min_price": payload.min_price_location,
+        "max_price": payload.max_price_location,
+        "black_list": payload.blacklist_location
+    }
+
+
+class _RowParser:
+    """
+    Parse từng hàng của sheet chính, dùng lại payload của vòng trước nếu fingerprint của hàng không đổi.
+    Hàng có CHECK khác '1' bị bỏ qua trước khi tạo model; hàng sai dữ liệu được gom lại để log.
+    """
+
+    def __init__(self, previous_cache: Dict[int, Tuple[int, Optional[Payload]]]):
+        Payload._build_maps_if_needed()
+        self.use_cache = settings.MAIN_SHEET_CHANGE_DETECTION
+        self.ignored_indexes = {Payload._index_map[field] for field in _LOG_FIELDS}
+        self.previous_cache = previous_cache
+        self.row_cache: Dict[int, Tuple[int, Optional[Payload]]] = {}
+        self.rejections: List[RowRejection] = []
+        self.row_count = 0
+        self.parsed_count = 0
+
+    def parse(self, row_index: int, row_data: List[str]) -> Optional[Payload]:
+        self.row_count += 1
+        fingerprint = _row_fingerprint(row_data, self.ignored_indexes) if self.use_cache else None
+        cached = self.previous_cache.get(row_index)
+        if cached is not None and cached[0] == fingerprint:
+            payload = cached[1]
+        else:
+            payload, rejection = Payload.decode_row(row_data, row_index=row_index, required_values=_ENABLED_ROW)
+            if rejection:
+                self.rejections.append(rejection)
+            self.parsed_count += 1
+        if self.use_cache:
+            self.row_cache[row_index] = (fingerprint, payload)
+        return payload
+
+    def finish(self) -> Dict[int, Tuple[int, Optional[Payload]]]:
+        if self.use_cache:
+            logging.info(f"Re-parsed {self.parsed_count}/{self.row_count} changed rows.")
+        if self.rejections:
+            logging.warning(f"Ignored {len(self.rejections)} invalid rows: " + "; ".join(
+                f"row {r.row_index} ({r.name}): {r.reason}" for r in self.rejections[:10]))
+        return self.row_cache
+
+
 class SheetService:
 
-    def __init__(self, client: GoogleSheetsClient):
+    def __init__(self, client: Union[ThreadedGoogleSheetsClient, AsyncGoogleSheetsClient],
+                 scheduler: Optional[SheetsRequestScheduler] = None):
         self.client = client
+        self.scheduler = scheduler or SheetsRequestScheduler()
+        # (spreadsheet id, A1 range đã chuẩn hóa) -> giá trị thô
+        self._range_cache = TTLCache(max_entries=settings.SHEET_CACHE_MAX_ENTRIES, default_ttl=0)
 
-    def get_payloads_to_process(self) -> List[Payload]:
-        all_rows = self.client.get_data(settings.MAIN_SHEET_ID, settings.MAIN_SHEET_NAME)
+        # Phát hiện thay đổi của sheet chính giữa các vòng
+        self._main_sheet_version: Optional[str] = None
+        self._main_sheet_read_at = 0.0
+        self._cached_payloads: Optional[List[Payload]] = None
+        self._row_cache: Dict[int, Tuple[int, Optional[Payload]]] = {}
+
+    async def get_payloads_to_process(self) -> List[Payload]:
+        version = None
+        if settings.MAIN_SHEET_CHANGE_DETECTION:
+            version = await self._get_main_sheet_version()
+            if self._can_reuse_payloads(version):
+                logging.info(f"Main sheet unchanged (version {version}), reusing {len(self._cached_payloads)} payloads.")
+                return [payload.model_copy() for payload in self._cached_payloads]
+
+        self._start_main_sheet_read(version)
+        if settings.MAIN_SHEET_READ_MODE == "projected":
+            indexed_rows = await self._read_main_sheet_projected()
+        else:
+            indexed_rows = await self._read_main_sheet_full()
+        if indexed_rows is None:
+            return []
+
+        payload_list = self._parse_rows(indexed_rows)
+
+        logging.info(f"Found {len(payload_list)} payloads to process.")
+        if settings.MAIN_SHEET_CHANGE_DETECTION:
+            self._cached_payloads = payload_list
+        # Trả về bản sao vì payload sẽ bị thay đổi trong quá trình xử lý
+        return [payload.model_copy() for payload in payload_list]
+
+    async def _read_main_sheet_full(self) -> Optional[List[Tuple[int, List[str]]]]:
+        """Đọc toàn bộ tab chính. Trả về [(số hàng trên sheet, dữ liệu hàng)] sau header."""
+        all_rows = await self.scheduler.run(
+            READ, PRIORITY_HEADER, self.client.get_data, settings.MAIN_SHEET_ID, settings.MAIN_SHEET_NAME)
         if not all_rows:
             logging.warning("No data found in the main sheet.")
-            return []
+            return None
 
         header_row_index = _find_header_row(all_rows, settings.HEADER_KEY_COLUMNS)
         if header_row_index is None:
             logging.error(f"Cannot find header row with columns: {settings.HEADER_KEY_COLUMNS}")
             logging.error("Please check the header row in your Google Sheet.")
-            return []
+            return None
 
-        data_rows = all_rows[header_row_index + 1:]
         start_row_on_sheet = header_row_index + 2
         logging.info(f"Starting from index {header_row_index + 1} (row {start_row_on_sheet} on sheet).")
+        return list(enumerate(all_rows[header_row_index + 1:], start=start_row_on_sheet))
+
+    async def _read_main_sheet_projected(self) -> Optional[List[Tuple[int, List[str]]]]:
+        """
+        Đọc tab chính theo hai bước:
+        1. batchGet các hàng đầu (để tìm header) và riêng cột CHECK.
+        2. batchGet chỉ các hàng có CHECK = '1', giới hạn trong các cột của model (A:AC).
+        """
+        Payload._build_maps_if_needed()
+        sheet_name = settings.MAIN_SHEET_NAME
+        check_col = Payload._col_map['is_check_enabled_str']
+        last_col = _index_to_col(max(Payload._index_map.values()))
+
+        header_range = f"'{sheet_name}'!A1:{last_col}{settings.HEADER_SCAN_ROWS}"
+        check_range = f"'{sheet_name}'!{check_col}:{check_col}"
+        phase_one = _align_to_requested_ranges(
+            [header_range, check_range],
+            await self.scheduler.run(READ, PRIORITY_HEADER, self.client.batch_get_data, settings.MAIN_SHEET_ID,
+                                     [header_range, check_range], 'FORMATTED_VALUE')
+        )
+        header_rows = phase_one.get(header_range) or []
+        check_values = phase_one.get(check_range) or []
+
+        header_row_index = _find_header_row(header_rows, settings.HEADER_KEY_COLUMNS)
+        if header_row_index is None:
+            logging.warning(f"Header not found in the first {settings.HEADER_SCAN_ROWS} rows, "
+                            f"falling back to a full read.")
+            return await self._read_main_sheet_full()
+
+        start_row_on_sheet = header_row_index + 2
+        enabled_rows = [
+            row_number for row_number, cells in enumerate(check_values, start=1)
+            if row_number >= start_row_on_sheet and cells and cells[0] == _ENABLED_ROW['is_check_enabled_str']
+        ]
+        logging.info(f"Projected read: {len(enabled_rows)}/{max(len(check_values) - header_row_index - 1, 0)} "
+                     f"rows enabled after header (row {start_row_on_sheet} on sheet).")
+
+        # Gộp các hàng liền nhau thành một dải A{start}:AC{end}
+        blocks: List[Tuple[int, int]] = []
+        for row_number in enabled_rows:
+            if blocks and blocks[-1][1] == row_number - 1:
+                blocks[-1] = (blocks[-1][0], row_number)
+            else:
+                blocks.append((row_number, row_number))
+
+        indexed_rows: List[Tuple[int, List[str]]] = []
+        for start in range(0, len(blocks), settings.MAIN_SHEET_BATCH_SIZE):
+            chunk = blocks[start:start + settings.MAIN_SHEET_BATCH_SIZE]
+            ranges = [f"'{sheet_name}'!A{first}:{last_col}{last}" for first, last in chunk]
+            fetched = _align_to_requested_ranges(
+                ranges,
+                await self.scheduler.run(READ, PRIORITY_HEADER, self.client.batch_get_data, settings.MAIN_SHEET_ID,
+                                         ranges, 'FORMATTED_VALUE')
+            )
+            for (first, _), range_name in zip(chunk, ranges):
+                indexed_rows.extend(enumerate(fetched.get(range_name) or [], start=first))
+        return indexed_rows
+
+    def _parse_rows(self, indexed_rows: List[Tuple[int, List[str]]]) -> List[Payload]:
+        """Parse các hàng dữ liệu; hàng nào không đổi so với vòng trước thì dùng lại payload đã parse."""
+        parser = _RowParser(self._row_cache)
+        payload_list = [payload for payload in (parser.parse(i, row_data) for i, row_data in indexed_rows)
+                        if payload and payload.is_check_enabled]
+        self._row_cache = parser.finish()
+        return payload_list
+
+    async def iter_payload_batches(self) -> AsyncIterator[List[Payload]]:
+        """
+        Trả về payload của vòng theo từng lô.
+        Chế độ "csv" export tab ra CSV và trả về mỗi MAIN_SHEET_STREAM_BATCH_SIZE payload ngay khi đọc được,
+        để việc xử lý bắt đầu trước khi tải xong; các chế độ khác trả về một lô duy nhất.
+        """
+        if settings.MAIN_SHEET_READ_MODE != "csv" or not hasattr(self.client, 'stream_csv_rows'):
+            if settings.MAIN_SHEET_READ_MODE == "csv":
+                logging.warning("Current Google Sheets client cannot stream CSV, using the JSON read instead.")
+            payloads = await self.get_payloads_to_process()
+            if payloads:
+                yield payloads
+            return
+
+        version = None
+        if settings.MAIN_SHEET_CHANGE_DETECTION:
+            version = await self._get_main_sheet_version()
+            if self._can_reuse_payloads(version):
+                logging.info(f"Main sheet unchanged (version {version}), reusing {len(self._cached_payloads)} payloads.")
+                if self._cached_payloads:
+                    yield [payload.model_copy() for payload in self._cached_payloads]
+                return
+
+        self._start_main_sheet_read(version)
+        parser = _RowParser(self._row_cache)
         payload_list: List[Payload] = []
-        for i, row_data in enumerate(data_rows, start=start_row_on_sheet):
-            payload = Payload.from_row(row_data, row_index=i)
+        batch: List[Payload] = []
+        header_found = False
+        row_number = 0
+        async for row_data in self.scheduler.stream(READ, PRIORITY_HEADER, self.client.stream_csv_rows,
+                                                    settings.MAIN_SHEET_ID, settings.MAIN_SHEET_NAME):
+            row_number += 1
+            if not header_found:
+                header_found = _find_header_row([row_data], settings.HEADER_KEY_COLUMNS) is not None
+                if header_found:
+                    logging.info(f"Streaming rows after header (row {row_number + 1} on sheet).")
+                continue
+
+            payload = parser.parse(row_number, row_data)
             if payload and payload.is_check_enabled:
                 payload_list.append(payload)
+                batch.append(payload.model_copy())
+                if len(batch) >= settings.MAIN_SHEET_STREAM_BATCH_SIZE:
+                    yield batch
+                    batch = []
 
-        logging.info(f"Found {len(payload_list)} payloads to process starting from row {start_row_on_sheet}.")
-        return payload_list
+        if not header_found:
+            logging.error(f"Cannot find header row with columns: {settings.HEADER_KEY_COLUMNS}")
+            return
 
-    def update_log_for_payload(self, payload: Payload, log_data: Dict[str, Any]):
+        self._row_cache = parser.finish()
+        if batch:
+            yield batch
+        logging.info(f"Found {len(payload_list)} payloads to process.")
+        if settings.MAIN_SHEET_CHANGE_DETECTION:
+            self._cached_payloads = payload_list
+
+    async def _get_main_sheet_version(self) -> Optional[str]:
+        """
+        Version (Drive) của sheet chính. Gọi thẳng client, không qua bộ điều phối: Drive API có quota riêng,
+        không nên tranh token với các lần đọc Sheets. Bị 429 thì coi như không biết version (đọc lại cả sheet).
+        """
+        try:
+            return await self.client.get_spreadsheet_version(settings.MAIN_SHEET_ID)
+        except SheetsRateLimitError as e:
+            logging.warning(f"Cannot get main sheet version (rate limited): {e}")
+            return None
+
+    def _can_reuse_payloads(self, version: Optional[str]) -> bool:
+        return (version is not None and version == self._main_sheet_version and self._cached_payloads is not None
+                and time.monotonic() - self._main_sheet_read_at < settings.MAIN_SHEET_MAX_REUSE_SECONDS)
+
+    def _start_main_sheet_read(self, version: Optional[str]):
+        """
+        Ghi nhận version ngay trước khi đọc lại sheet chính; cache payload cũ bị bỏ cho tới khi đọc xong.
+        Các lần flush log trong lúc đang đọc sẽ cập nhật version này qua record_main_sheet_write.
+        """
+        self._main_sheet_version = version
+        self._main_sheet_read_at = time.monotonic()
+        self._cached_payloads = None
+
+    async def record_main_sheet_write(self):
+        """
+        Gọi sau mỗi lần flush log thành công: lấy version mới của file làm version "đã biết",
+        để việc ghi note/last_update của chính bot không làm vòng sau phải đọc lại cả sheet.
+
+        Drive không cho biết ai đã tạo version nào, nên thay đổi của người dùng giữa lần kiểm tra version
+        đầu vòng và lần flush này cũng bị coi là của bot. Khoảng hở đó được giới hạn bởi
+        MAIN_SHEET_MAX_REUSE_SECONDS: quá thời gian này sheet chính luôn được đọc lại.
+        """
+        if not settings.MAIN_SHEET_CHANGE_DETECTION or self._main_sheet_version is None:
+            return
+        self._main_sheet_version = await self._get_main_sheet_version()
+
+    async def update_log_for_payload(self, payload: Payload, log_data: Dict[str, Any]):
         try:
             update_request = payload.prepare_update(
                 settings.MAIN_SHEET_NAME,
                 log_data
             )
             if update_request:
-                self.client.batch_update(settings.MAIN_SHEET_ID, update_request)
+                await self.scheduler.run(
+                    WRITE, PRIORITY_LOG_WRITE, self.client.batch_update, settings.MAIN_SHEET_ID, update_request)
                 logging.info(f"-> Successfully updated for row {payload.row_index} with data: {log_data}")
         except Exception as e:
             logging.error(f"Cannot update log for row {payload.row_index} ({payload.product_name}): {e}")
 
-    def fetch_data_for_payload(self, payload: Payload) -> Payload:
-        locations_to_fetch = {
-            "min_price": payload.min_price_location,
-            "max_price": payload.max_price_location,
-            "stock": payload.stock_location,
-            "black_list": payload.blacklist_location
-        }
-
-        requests_by_spreadsheet = defaultdict(list)
-        range_to_key_map = {}
-
-        for key, loc in locations_to_fetch.items():
-            if loc and loc.sheet_id and loc.sheet_name and loc.cell:
-                range_name = f"'{loc.sheet_name}'!{loc.cell}"
-                processed_ranges = _process_unbounded_range(range_name)
-                requests_by_spreadsheet[loc.sheet_id].append(processed_ranges)
-                range_to_key_map[processed_ranges] = key
-
-        for sheet_id, ranges in requests_by_spreadsheet.items():
-            fetched_values_map = self.client.batch_get_data(sheet_id, ranges)
-
-            for response_range, raw_value in fetched_values_map.items():
-                key = range_to_key_map.get(response_range)
-                if not key:
+    async def batch_update_main_sheet(self, update_requests: List[Dict[str, Any]]):
+        await self.scheduler.run(
+            WRITE, PRIORITY_LOG_WRITE, self.client.batch_update, settings.MAIN_SHEET_ID, update_requests)
+
+    async def fetch_data_for_payload(self, payload: Payload) -> Payload:
+        await self.hydrate_payloads([payload])
+        return payload
+
+    async def hydrate_payloads(self, payloads: List[Payload]) -> List[Payload]:
+        """
+        Lấy min/max/blacklist cho tất cả payload của một vòng.
+        Các dải ô trùng nhau được gộp lại, mỗi spreadsheet chỉ gọi một lần batchGet.
+        """
+        # sheet_id -> range -> [(payload, key), ...]
+        requests_by_spreadsheet: Dict[str, Dict[str, List[Tuple[Payload, str]]]] = defaultdict(
+            lambda: defaultdict(list))
+
+        for payload in payloads:
+            payload.hydration_failed = False
+            for key, loc in _payload_locations(payload).items():
+                if loc and loc.sheet_id and loc.sheet_name and loc.cell:
+                    range_name = f"'{loc.sheet_name}'!{loc.cell}"
+                    processed_range = _process_unbounded_range(range_name)
+                    requests_by_spreadsheet[loc.sheet_id][processed_range].append((payload, key))
+
+        # Mỗi spreadsheet một batchGet, các spreadsheet khác nhau chạy song song
+        fetched_counts = await asyncio.gather(*[
+            self._hydrate_spreadsheet(sheet_id, targets_by_range)
+            for sheet_id, targets_by_range in requests_by_spreadsheet.items()
+        ])
+        fetched_count = sum(fetched_counts)
+
+        logging.info(f"Hydrated {len(payloads)} payloads from "
+                     f"{sum(len(r) for r in requests_by_spreadsheet.values())} distinct ranges "
+                     f"in {len(requests_by_spreadsheet)} spreadsheets ({fetched_count} fetched). "
+                     f"Range cache: {self._range_cache.stats()}")
+        return payloads
+
+    async def _hydrate_spreadsheet(self, sheet_id: str,
+                                   targets_by_range: Dict[str, List[Tuple[Payload, str]]]) -> int:
+        values_by_range = {}
+        ranges = []
+        for range_name in targets_by_range:
+            cached = self._range_cache.get((sheet_id, range_name))
+            if cached is MISSING:
+                ranges.append(range_name)
+            else:
+                values_by_range[range_name] = cached
+
+        failed_ranges = []
+        for start in range(0, len(ranges), settings.HYDRATION_BATCH_SIZE):
+            chunk = ranges[start:start + settings.HYDRATION_BATCH_SIZE]
+            fetched, failed = await self._batch_get_ranges(sheet_id, chunk)
+            failed_ranges.extend(failed)
+            for range_name, raw_value in fetched.items():
+                if range_name not in targets_by_range:
                     continue
+                ttl = min(_cache_ttl(key) for _, key in targets_by_range[range_name])
+                self._range_cache.set((sheet_id, range_name), raw_value, ttl=ttl)
+            values_by_range.update(fetched)
 
+        for requested_range, raw_value in values_by_range.items():
+            for payload, key in targets_by_range.get(requested_range, []):
                 processed_value = _process_fetched_value(key, raw_value)
-
                 if processed_value is not None:
                     setattr(payload, f"fetched_{key}", processed_value)
 
-        return payload
+        # Hàng tham chiếu dải ô không đọc được không được định giá (thiếu min/max sẽ không bị chặn giá)
+        for range_name in failed_ranges:
+            for payload, key in targets_by_range.get(range_name, []):
+                payload.hydration_failed = True
+
+        return len(ranges)
+
+    async def _batch_get_ranges(self, sheet_id: str, ranges: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        batchGet một nhóm dải ô. API từ chối cả request khi chỉ một dải ô sai (400), nên khi lỗi
+        nhóm được chia đôi và thử lại: chỉ các dải ô sai bị bỏ, các hàng khác vẫn được hydrate.
+
+        Returns:
+            (giá trị theo dải ô đã yêu cầu, các dải ô không đọc được)
+        """
+        try:
+            fetched_values = await self.scheduler.run(
+                READ, PRIORITY_HYDRATION, self.client.batch_get_values, sheet_id, ranges)
+        except SheetsRequestError as e:
+            if len(ranges) == 1:
+                logging.error(f"Cannot read range {ranges[0]} from spreadsheet {sheet_id}: {e}")
+                return {}, ranges
+            middle = len(ranges) // 2
+            (left, left_failed), (right, right_failed) = await asyncio.gather(
+                self._batch_get_ranges(sheet_id, ranges[:middle]),
+                self._batch_get_ranges(sheet_id, ranges[middle:]))
+            return {**left, **right}, left_failed + right_failed
+        # batchGet giữ thứ tự các dải ô đã gửi; dải ô không có kết quả tương ứng bị coi là không đọc được
+        missing = ranges[len(fetched_values):]
+        if missing:
+            logging.error(f"batchGet of spreadsheet {sheet_id} returned {len(fetched_values)}/{len(ranges)} ranges, "
+                          f"missing: {missing}")
+        return dict(zip(ranges, fetched_values)), missing
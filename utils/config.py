@@ -1,7 +1,9 @@
 # utils/config.py
 import json
+import math
 from typing import List, Optional
 
+import httpx
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -11,6 +13,8 @@ class Settings(BaseSettings):
     MAIN_SHEET_ID: str
     MAIN_SHEET_NAME: str
     GOOGLE_KEY_PATH: str
+    # Danh sách key của nhiều service account (JSON), để cộng dồn quota Google Sheets; rỗng = chỉ dùng GOOGLE_KEY_PATH
+    GOOGLE_KEY_PATHS_JSON: str = '[]'
 
     HEADER_KEY_COLUMNS_JSON: str = '["CHECK", "Product_name", "Product_pack"]'
     SLEEP_TIME: int = 5
@@ -20,12 +24,122 @@ class Settings(BaseSettings):
     CLIENT_ID: str
     AUTH_ID: str
     AUTH_SECRET: str
+    # Làm mới token ở background trước khi hết hạn N giây; file lưu token để khởi động lại không cần đăng nhập
+    AUTH_REFRESH_AHEAD_SECONDS: float = 300
+    AUTH_TOKEN_CACHE_PATH: str = ".eneba_token.json"
     WORKERS: Optional[float] = 1
+    # httpx.AsyncClient dùng chung: HTTP/2 (cần gói h2), pool = max(HTTP_MIN_CONNECTIONS, WORKERS * CONNECTIONS_PER_WORKER)
+    HTTP2_ENABLED: bool = True
+    HTTP_CONNECTIONS_PER_WORKER: float = 2
+    HTTP_MIN_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 120
+    # Timeout (giây): mặc định cho mọi request, chờ kết nối / chờ slot trong pool, và riêng từng loại thao tác
+    HTTP_TIMEOUT: float = 30
+    HTTP_CONNECT_TIMEOUT: float = 10
+    HTTP_POOL_TIMEOUT: float = 30
+    ENEBA_QUERY_TIMEOUT: float = 30
+    ENEBA_MUTATION_TIMEOUT: float = 20
+    AUTH_TIMEOUT: float = 15
+    # Giới hạn tốc độ request Eneba (request/phút) tự điều chỉnh: tăng dần khi thành công,
+    # nhân với DECREASE_FACTOR và tạm dừng mọi request khi gặp "Too Many Requests".
+    # INITIAL = 0: không giới hạn cho tới lần bị 429 đầu tiên (khi đó giảm từ MAX)
+    ENEBA_RATE_INITIAL_PER_MINUTE: float = 0
+    ENEBA_RATE_MIN_PER_MINUTE: float = 10
+    ENEBA_RATE_MAX_PER_MINUTE: float = 600
+    ENEBA_RATE_INCREASE_PER_MINUTE: float = 1
+    ENEBA_RATE_DECREASE_FACTOR: float = 0.5
+    ENEBA_RATE_BURST: float = 5
+    # Gộp các GraphQL query/mutation gọi đồng thời thành một request (alias), tối đa N operation
+    # hoặc chờ tối đa MAX_WAIT_MS mili giây
+    GRAPHQL_BATCH_ENABLED: bool = True
+    GRAPHQL_BATCH_MAX_SIZE: int = 10
+    GRAPHQL_BATCH_MAX_WAIT_MS: float = 20
+    # Gộp các lần cập nhật giá (S_updateAuction) trong MAX_WAIT_MS thành một request tối đa
+    # min(MAX_SIZE, WORKERS) offer (gửi ngay khi đủ); offer bị lỗi được gửi lại riêng tối đa MAX_RETRIES lần
+    PRICE_UPDATE_BATCH_ENABLED: bool = True
+    PRICE_UPDATE_BATCH_MAX_SIZE: int = 20
+    PRICE_UPDATE_BATCH_MAX_WAIT_MS: float = 200
+    PRICE_UPDATE_MAX_RETRIES: int = 2
+    # Số productIds tối đa trong một request S_competition khi prefetch cho cả vòng
+    COMPETITION_BATCH_SIZE: int = 20
+    # Số người bán lấy mỗi trang S_competition (0 = lấy hết như cũ, mặc định); chỉ lấy thêm trang sau khi
+    # không còn người bán nào qua được bộ lọc blacklist/min/max, tối đa COMPETITION_MAX_PAGES trang.
+    # Chỉ bật khi API trả người bán theo giá tăng dần (tự tắt nếu phát hiện trang không sắp theo giá)
+    COMPETITION_PAGE_SIZE: int = 0
+    COMPETITION_MAX_PAGES: int = 5
+    # File cache slug -> product id (rỗng = chỉ cache trong bộ nhớ) và số slug tối đa mỗi request S_products
+    SLUG_CACHE_PATH: str = "slug_cache.json"
+    SLUG_RESOLVE_BATCH_SIZE: int = 50
+    # Số sản phẩm yêu cầu cho mỗi slug (first = số slug * N): một slug có thể khớp nhiều sản phẩm;
+    # khi trang trả về vẫn đầy, các slug chưa tìm thấy được hỏi lại ở request tiếp theo
+    SLUG_RESOLVE_RESULTS_PER_SLUG: int = 2
+    # Cache kết quả S_calculatePrice theo (product, giá cents, currency) (giây, 0 = không cache)
+    COMMISSION_CACHE_MAX_ENTRIES: int = 10000
+    COMMISSION_CACHE_TTL: float = 1800
+    # Mô hình commission cục bộ: cần tối thiểu N mẫu khớp trong một bậc giá (sai số cent),
+    # kiểm tra lại bằng API sau mỗi N lần trả lời cục bộ; file lưu mẫu (rỗng = không lưu)
+    COMMISSION_MODEL_ENABLED: bool = True
+    COMMISSION_MODEL_MIN_SAMPLES: int = 4
+    COMMISSION_MODEL_TOLERANCE_CENTS: int = 1
+    COMMISSION_MODEL_REVALIDATE_EVERY: int = 50
+    # Chỉ nội suy khi hai mẫu kề nhau cách nhau không quá tỉ lệ này của giá cần đoán
+    COMMISSION_MODEL_MAX_GAP_RATIO: float = 0.1
+    COMMISSION_MODEL_PATH: str = ""
+    # Số dải ô tối đa trong một lần batchGet khi hydrate (tránh URL quá dài)
+    HYDRATION_BATCH_SIZE: int = 200
+    # Google Sheets client: "googleapiclient" (đồng bộ, chạy trong thread), "httpx" (async)
+    # hoặc "fake" (giả lập trong bộ nhớ/CSV để chạy thử và benchmark)
+    SHEETS_CLIENT: str = "googleapiclient"
+    FAKE_SHEETS_DIR: str = "fake_sheets"
+    FAKE_SHEETS_LATENCY: float = 0.0
+    FAKE_SHEETS_QUOTA_ERROR_RATE: float = 0.0
+    # Bỏ qua việc đọc lại/parse lại sheet chính khi không có thay đổi (cần bật Drive API)
+    MAIN_SHEET_CHANGE_DETECTION: bool = True
+    # Đọc lại sheet chính ít nhất mỗi N giây dù version không đổi (giới hạn thời gian bỏ sót
+    # thay đổi của người dùng rơi vào giữa vòng, trước lần flush log của bot)
+    MAIN_SHEET_MAX_REUSE_SECONDS: int = 600
+    # Cách đọc sheet chính: "full" (cả tab), "projected" (header + cột CHECK, rồi chỉ các hàng bật)
+    # hoặc "csv" (export CSV dạng stream, xử lý từng lô MAIN_SHEET_STREAM_BATCH_SIZE payload khi đang tải)
+    MAIN_SHEET_READ_MODE: str = "full"
+    MAIN_SHEET_STREAM_BATCH_SIZE: int = 100
+    HEADER_SCAN_ROWS: int = 10
+    MAIN_SHEET_BATCH_SIZE: int = 200
+    # Quota Google Sheets (request/phút, tính cho MỖI service account) cho bộ điều phối, và số lần thử lại khi gặp 429
+    SHEETS_READS_PER_MINUTE: float = 60
+    SHEETS_WRITES_PER_MINUTE: float = 60
+    SHEETS_BUCKET_BURST: float = 10
+    SHEETS_MAX_RETRIES: int = 5
+    # Cache các ô min/max/stock/blacklist được tham chiếu (giây, 0 = không cache)
+    SHEET_CACHE_MAX_ENTRIES: int = 5000
+    SHEET_CACHE_TTL_MIN_PRICE: float = 60
+    SHEET_CACHE_TTL_MAX_PRICE: float = 60
+    SHEET_CACHE_TTL_STOCK: float = 60
+    SHEET_CACHE_TTL_BLACKLIST: float = 3600
+    # Ghi log (note/last_update) kiểu write-behind: flush khi đủ số hàng hoặc hết thời gian chờ
+    LOG_FLUSH_MAX_ROWS: int = 50
+    LOG_FLUSH_INTERVAL: float = 10.0
+    # Bỏ qua ghi note khi nội dung không đổi; vẫn ghi lại sau mỗi NOTE_HEARTBEAT_SECONDS (0 = luôn ghi)
+    NOTE_HEARTBEAT_SECONDS: float = 600
+
     @property
     def HEADER_KEY_COLUMNS(self) -> List[str]:
         """Chuyển đổi chuỗi JSON của các cột key thành một danh sách Python."""
         return json.loads(self.HEADER_KEY_COLUMNS_JSON)
 
+    @property
+    def HTTP_MAX_CONNECTIONS(self) -> int:
+        """Số kết nối tối đa của client dùng chung, theo số worker chạy đồng thời."""
+        return max(self.HTTP_MIN_CONNECTIONS, math.ceil((self.WORKERS or 1) * self.HTTP_CONNECTIONS_PER_WORKER))
+
+    def http_timeout(self, seconds: float) -> httpx.Timeout:
+        """Timeout cho một loại thao tác; connect/pool timeout dùng chung."""
+        return httpx.Timeout(seconds, connect=self.HTTP_CONNECT_TIMEOUT, pool=self.HTTP_POOL_TIMEOUT)
+
+    @property
+    def GOOGLE_KEY_PATHS(self) -> List[str]:
+        """Các file key service account dùng cho Google Sheets (mặc định chỉ GOOGLE_KEY_PATH)."""
+        return json.loads(self.GOOGLE_KEY_PATHS_JSON) or [self.GOOGLE_KEY_PATH]
+
 
 # Tạo một instance duy nhất để import và sử dụng trong toàn bộ dự án
 settings = Settings()
@@ -0,0 +1,24 @@
+import csv
+from typing import AsyncIterator, List
+
+
+async def aiter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[List[str]]:
+    """
+    Parse CSV từng dòng khi dữ liệu đang về.
+    Ô có xuống dòng (trong dấu ngoặc kép) bị tách thành nhiều dòng, nên các dòng được
+    gom lại cho đến khi số dấu '"' là số chẵn rồi mới parse thành một record.
+    """
+    buffer: List[str] = []
+    quote_count = 0
+    async for line in lines:
+        buffer.append(line)
+        quote_count += line.count('"')
+        if quote_count % 2:
+            continue
+        record = "\n".join(buffer)
+        buffer, quote_count = [], 0
+        for row in csv.reader([record]):
+            yield row
+    if buffer:
+        for row in csv.reader(["\n".join(buffer)]):
+            yield row
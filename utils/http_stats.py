@@ -0,0 +1,54 @@
+from collections import Counter
+from typing import Any, Dict
+
+import httpx
+
+
+class HttpConnectionStats:
+    """
+    Đếm số request / kết nối TCP / TLS handshake mới trên httpx.AsyncClient dùng chung,
+    qua trace extension của httpcore (gắn vào mọi request bằng event hook "request").
+    Request không mở kết nối mới là request đã dùng lại kết nối trong pool (keep-alive hoặc HTTP/2).
+    """
+
+    def __init__(self):
+        self.requests: Counter = Counter()
+        self.connections: Counter = Counter()
+        self.tls_handshakes: Counter = Counter()
+        self.http_versions: Counter = Counter()
+
+    async def on_request(self, request: httpx.Request):
+        """Event hook "request" của httpx: gắn trace callback theo host của request."""
+        host = request.url.host
+        self.requests[host] += 1
+
+        async def trace(event: str, info: Dict[str, Any]):
+            if event == "connection.connect_tcp.complete":
+                self.connections[host] += 1
+            elif event == "connection.start_tls.complete":
+                self.tls_handshakes[host] += 1
+            elif event.endswith(".send_request_headers.started"):
+                # "http11.send_request_headers.started" / "http2.send_request_headers.started"
+                self.http_versions[event.split(".", 1)[0]] += 1
+
+        request.extensions["trace"] = trace
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hosts": {
+                host: {
+                    "requests": count,
+                    "new_connections": self.connections[host],
+                    "tls_handshakes": self.tls_handshakes[host],
+                    "reused": max(count - self.connections[host], 0),
+                }
+                for host, count in self.requests.items()
+            },
+            "protocols": dict(self.http_versions),
+        }
+
+    def reset_stats(self):
+        self.requests.clear()
+        self.connections.clear()
+        self.tls_handshakes.clear()
+        self.http_versions.clear()
@@ -0,0 +1,47 @@
+import time
+
+
+class TokenBucket:
+    """Token bucket nạp lại đều theo thời gian (rate_per_minute token/phút, tối đa capacity token)."""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    @property
+    def level(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """Số giây cần chờ đến khi đủ token (0 nếu có thể lấy ngay)."""
+        self._refill()
+        if self._tokens >= tokens:
+            return 0.0
+        if self.rate_per_second <= 0:
+            return float('inf')
+        return (tokens - self._tokens) / self.rate_per_second
+
+    def try_consume(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def set_rate(self, rate_per_minute: float):
+        """Đổi tốc độ nạp (token đã tích lũy được giữ nguyên)."""
+        self._refill()
+        self.rate_per_second = rate_per_minute / 60.0
+
+    def drain(self):
+        """Xả hết token (dùng khi server báo quá quota)."""
+        self._refill()
+        self._tokens = 0.0
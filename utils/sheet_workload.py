@@ -0,0 +1,116 @@
+# utils/sheet_workload.py
+"""
+Sinh dữ liệu sheet giả lập (sheet chính + các sheet min/max/blacklist dùng chung) cho FakeGoogleSheetsClient.
+
+Chạy trực tiếp để xuất ra CSV:
+    python -m utils.sheet_workload --rows 10000 --out fake_sheets
+"""
+import argparse
+import random
+import uuid
+from typing import List
+
+from clients.fake_google_sheets_client import FakeGoogleSheetsClient
+
+MAIN_HEADER = [
+    "2LAI", "CHECK", "Product_name", "Product_pack", "Note", "Last_update", "Product_id", "Compare",
+    "Product_compare", "Include_keyword", "Filter", "Min_adj", "Min_adj2", "Max_adj", "Rounding",
+    "ID_min", "Sheet_min", "Cell_min", "ID_max", "Sheet_max", "Cell_max",
+    "ID_stock", "Sheet_stock", "Cell_stock", "ID_blacklist", "Sheet_blacklist", "Cell_blacklist",
+    "Relax", "Min_price",
+]
+
+PRICE_SPREADSHEET_ID = "fake-prices"
+PRICE_SHEET_NAME = "Prices"
+BLACKLIST_SPREADSHEET_ID = "fake-blacklist"
+BLACKLIST_SHEET_NAME = "Blacklist"
+
+
+def _generate_price_sheet(rng: random.Random, price_refs: int) -> List[List[str]]:
+    rows = [["Product", "Min", "Max", "Stock"]]
+    for i in range(price_refs):
+        min_price = round(rng.uniform(1, 200), 2)
+        rows.append([f"Ref {i}", str(min_price), str(round(min_price * rng.uniform(1.1, 1.6), 2)),
+                     str(rng.randint(0, 500))])
+    return rows
+
+
+def _generate_blacklists(rng: random.Random, blacklists: int, merchants_per_list: int) -> List[List[str]]:
+    """Mỗi cột là một blacklist riêng (A, B, C...)."""
+    columns = [[f"Merchant{rng.randint(0, 999)}" for _ in range(merchants_per_list)] for _ in range(blacklists)]
+    return [list(row) for row in zip(*columns)]
+
+
+def _generate_main_row(rng: random.Random, index: int, enabled_ratio: float, price_refs: int,
+                       blacklists: int) -> List[str]:
+    ref_row = rng.randint(2, price_refs + 1)
+    blacklist_col = chr(ord('A') + rng.randrange(blacklists))
+    slug = f"fake-product-{rng.randint(0, max(1, price_refs // 2))}"
+    return [
+        "",
+        "1" if rng.random() < enabled_ratio else "0",
+        f"Product {index}",
+        f"Pack {index % 7}",
+        "",
+        "",
+        f"https://www.eneba.com/offer/{uuid.UUID(int=rng.getrandbits(128))}",
+        rng.choice(["1", "1", "1", "0", "2"]),
+        f"https://www.eneba.com/{slug}",
+        "",
+        "",
+        "0.01",
+        "0.005",
+        "0.03",
+        "2",
+        PRICE_SPREADSHEET_ID, PRICE_SHEET_NAME, f"B{ref_row}",
+        PRICE_SPREADSHEET_ID, PRICE_SHEET_NAME, f"C{ref_row}",
+        PRICE_SPREADSHEET_ID, PRICE_SHEET_NAME, f"D{ref_row}",
+        BLACKLIST_SPREADSHEET_ID, BLACKLIST_SHEET_NAME, f"{blacklist_col}:{blacklist_col}",
+        rng.choice(["", "", "0", "1"]),
+        f"{rng.uniform(1, 100):.2f}",
+    ]
+
+
+def generate_workload(
+        client: FakeGoogleSheetsClient,
+        main_sheet_id: str,
+        main_sheet_name: str,
+        rows: int = 1000,
+        enabled_ratio: float = 0.6,
+        price_refs: int = 200,
+        blacklists: int = 3,
+        merchants_per_list: int = 30,
+        seed: int = 0
+):
+    """
+    Điền vào client một sheet chính có `rows` hàng, trỏ tới một pool nhỏ các ô min/max/stock
+    và vài blacklist dùng chung, giống cách sheet thật được tổ chức.
+    """
+    rng = random.Random(seed)
+    client.set_sheet(PRICE_SPREADSHEET_ID, PRICE_SHEET_NAME, _generate_price_sheet(rng, price_refs))
+    client.set_sheet(BLACKLIST_SPREADSHEET_ID, BLACKLIST_SHEET_NAME,
+                     _generate_blacklists(rng, blacklists, merchants_per_list))
+    main_rows = [MAIN_HEADER] + [
+        _generate_main_row(rng, i, enabled_ratio, price_refs, blacklists) for i in range(rows)
+    ]
+    client.set_sheet(main_sheet_id, main_sheet_name, main_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Google Sheets workload as CSV files.")
+    parser.add_argument("--out", default="fake_sheets")
+    parser.add_argument("--main-sheet-id", default="fake-main")
+    parser.add_argument("--main-sheet-name", default="Main")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--enabled-ratio", type=float, default=0.6)
+    parser.add_argument("--price-refs", type=int, default=200)
+    parser.add_argument("--blacklists", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake_client = FakeGoogleSheetsClient(data_dir=args.out)
+    generate_workload(fake_client, args.main_sheet_id, args.main_sheet_name, rows=args.rows,
+                      enabled_ratio=args.enabled_ratio, price_refs=args.price_refs,
+                      blacklists=args.blacklists, seed=args.seed)
+    fake_client.save()
+    print(f"Generated {args.rows} rows into '{args.out}/'.")
@@ -0,0 +1,34 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi giống nhau đang chạy đồng thời: lời gọi đầu tiên thực sự chạy,
+    các lời gọi cùng key đến sau chờ và nhận chung kết quả (hoặc lỗi).
+    Key được bỏ ngay khi lời gọi kết thúc, nên không cache kết quả giữa các lần gọi.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield: một caller bị hủy không làm hủy request mà các caller khác đang chờ
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def reset_stats(self):
+        self.calls = 0
+        self.coalesced = 0
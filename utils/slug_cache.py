@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+from typing import Dict, Iterable, Optional
+from uuid import UUID
+
+
+class SlugCache:
+    """
+    Cache slug -> product UUID lưu trên đĩa (JSON).
+    Slug của một sản phẩm Eneba không đổi, nên cache không có TTL; được nạp khi khởi động
+    và ghi lại (atomic) mỗi khi có slug mới được resolve.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self._data: Dict[str, UUID] = {}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            self._data = {slug: UUID(product_id) for slug, product_id in raw.items()}
+            self.logger.info(f"Loaded {len(self._data)} slug -> product id entries from '{self.path}'.")
+        except (OSError, ValueError, AttributeError) as e:
+            self.logger.warning(f"Cannot load slug cache '{self.path}', starting empty: {e}")
+            self._data = {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({slug: str(product_id) for slug, product_id in self._data.items()}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Cannot save slug cache '{self.path}': {e}")
+
+    def get(self, slug: str) -> Optional[UUID]:
+        return self._data.get(slug)
+
+    def missing(self, slugs: Iterable[str]) -> list[str]:
+        return [slug for slug in dict.fromkeys(slugs) if slug not in self._data]
+
+    def update(self, resolved: Dict[str, UUID]):
+        if not resolved:
+            return
+        self._data.update(resolved)
+        self.save()
+
+    def invalidate(self, slug: str):
+        if self._data.pop(slug, None) is not None:
+            self.save()
+
+    def __contains__(self, slug: str) -> bool:
+        return slug in self._data
+
+    def __len__(self):
+        return len(self._data)